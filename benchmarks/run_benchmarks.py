@@ -0,0 +1,313 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+import numpy as np
+
+from models.clg import create_clg_lattice, parallel_update, vectorized_parallel_update, random_sequential_update
+from models.manna import create_manna_lattice, parallel_manna_update, vectorized_manna_update
+from models.packed_clg import PackedCLGLattice
+from observables.compression import COMPRESSORS, lz_78, lz_78_phrase_count, cid, cid_cache, random_reference
+from observables.encoding import encode_configuration
+from utils.simulator import Z, create_realization
+from utils.data_analysis_tools import analyze_data
+
+
+#==============================================================================
+# benchmark suite of the models, the compression and the end to end sweep.
+# every benchmark is run for every lattice size in SIZES up to its max_size and
+# for every one of its densities, with the global generators and the numpy
+# Generator of the benchmark reseeded with BENCHMARK_SEED before each run so
+# two runs of the suite measure exactly the same work. a run records the best
+# wall time over the repeats, the throughput (site updates or bytes per
+# second) and the peak memory allocated by python and numpy (tracemalloc, the
+# memory of worker processes is not seen) and is written to a json file. two
+# such files, e.g of two commits, are compared with
+#     python -m benchmarks.run_benchmarks compare baseline.json candidate.json
+# which lists the benchmarks slower (or larger) by more than the threshold
+#==============================================================================
+
+BENCHMARK_SEED = 12345
+
+SIZES = [10**3, 10**4, 10**5, 10**6]
+
+CLG_DENSITIES = [0.3, 0.5, 0.7]
+
+MANNA_DENSITIES = [0.5, 0.9, 1.5]
+
+# number of timesteps of the synchronous updates, the sequential updates make
+# a sweep of L hops (at most MAX_HOPS)
+PARALLEL_TIMESTEPS = 10
+MAX_HOPS = 10**5
+
+# the work of a benchmark is the number of site updates (or hops) of the
+# models and the number of encoded bytes of the compressors
+SITE_UPDATES = 'site-updates/s'
+BYTES = 'bytes/s'
+
+# setup(L, density, rng) prepares a run outside of the timed region and returns
+# the function to time and the amount of work it performs
+Benchmark = namedtuple('Benchmark', ['setup', 'unit', 'max_size', 'densities'])
+
+
+def clg_lattice(L, density, rng):
+    return create_clg_lattice(int(L*density), L, rng)
+
+
+def manna_lattice(L, density, rng):
+    return create_manna_lattice(int(L*density), L, rng)
+
+
+def setup_parallel_update(L, density, rng):
+    lattice = clg_lattice(L, density, rng)
+    return (lambda: parallel_update(lattice, 1)), L
+
+
+def setup_vectorized_parallel_update(L, density, rng):
+    lattice = clg_lattice(L, density, rng)
+    return (lambda: vectorized_parallel_update(lattice, PARALLEL_TIMESTEPS, rng=rng)), L*PARALLEL_TIMESTEPS
+
+
+def setup_packed_parallel_update(L, density, rng):
+    lattice = PackedCLGLattice.from_lattice(clg_lattice(L, density, rng))
+    return (lambda: lattice.parallel_update(PARALLEL_TIMESTEPS, rng=rng)), L*PARALLEL_TIMESTEPS
+
+
+def setup_random_sequential_update(L, density, rng):
+    lattice = clg_lattice(L, density, rng)
+    hops = min(L, MAX_HOPS)
+    return (lambda: random_sequential_update(lattice, hops, rng=rng)), hops
+
+
+def setup_parallel_manna_update(L, density, rng):
+    lattice = manna_lattice(L, density, rng)
+    return (lambda: parallel_manna_update(lattice, 1, Z)), L
+
+
+def setup_vectorized_manna_update(L, density, rng):
+    lattice = manna_lattice(L, density, rng)
+    return (lambda: vectorized_manna_update(lattice, PARALLEL_TIMESTEPS, Z, rng=rng)), L*PARALLEL_TIMESTEPS
+
+
+def setup_lz_78(L, density, rng):
+    symbols = encode_configuration(clg_lattice(L, density, rng))
+    return (lambda: lz_78(symbols)), len(symbols)
+
+
+def setup_lz_78_phrase_count(L, density, rng):
+    symbols = encode_configuration(clg_lattice(L, density, rng))
+    return (lambda: lz_78_phrase_count(symbols)), len(symbols)
+
+
+def setup_cid(compressor):
+    def setup(L, density, rng):
+        symbols = encode_configuration(clg_lattice(L, density, rng))
+        # the reference is cached once per length, only the compression is timed
+        random_reference(len(symbols), compressor=compressor)
+
+        def run():
+            cid_cache.clear()
+            return cid(symbols, compressor=compressor)
+        return run, len(symbols)
+    return setup
+
+
+def setup_create_realization(L, density, rng):
+    T = [L]
+    return (lambda: create_realization(L, [int(L*density)], T, 0, seed=BENCHMARK_SEED)), L*(len(T)+1)
+
+
+def setup_analyze_data(L, density, rng, realizations=4):
+    N, T = [int(L*density)], [L]
+    for r in range(realizations):
+        create_realization(L, N, T, r, seed=BENCHMARK_SEED)
+    return (lambda: analyze_data(N, T, realizations)), realizations*L*(len(T)+1)
+
+
+def setup_run_simulation(L, density, rng, realizations=2):
+    from main import run_simulation
+    N, T = [int(L*density)], [L, L]
+    return (lambda: run_simulation(L, N, T, realizations, 'clg', seed=BENCHMARK_SEED)), realizations*L*(len(T)+1)
+
+
+BENCHMARKS = {
+    'parallel_update': Benchmark(setup_parallel_update, SITE_UPDATES, 10**5, CLG_DENSITIES),
+    'vectorized_parallel_update': Benchmark(setup_vectorized_parallel_update, SITE_UPDATES, 10**6, CLG_DENSITIES),
+    'packed_parallel_update': Benchmark(setup_packed_parallel_update, SITE_UPDATES, 10**6, CLG_DENSITIES),
+    'random_sequential_update': Benchmark(setup_random_sequential_update, SITE_UPDATES, 10**6, CLG_DENSITIES),
+    'parallel_manna_update': Benchmark(setup_parallel_manna_update, SITE_UPDATES, 10**5, MANNA_DENSITIES),
+    'vectorized_manna_update': Benchmark(setup_vectorized_manna_update, SITE_UPDATES, 10**6, MANNA_DENSITIES),
+    'lz_78': Benchmark(setup_lz_78, BYTES, 10**4, CLG_DENSITIES),
+    'lz_78_phrase_count': Benchmark(setup_lz_78_phrase_count, BYTES, 10**6, CLG_DENSITIES),
+    'create_realization': Benchmark(setup_create_realization, SITE_UPDATES, 10**4, CLG_DENSITIES),
+    'analyze_data': Benchmark(setup_analyze_data, SITE_UPDATES, 10**4, [0.5]),
+    'run_simulation': Benchmark(setup_run_simulation, SITE_UPDATES, 10**3, [0.5]),
+}
+for compressor in COMPRESSORS:
+    BENCHMARKS['cid_' + compressor] = Benchmark(setup_cid(compressor), BYTES, 10**6, CLG_DENSITIES)
+
+
+def seeded_setup(benchmark, L, density):
+    ''' reseeds every generator and prepares a run of a benchmark '''
+    random.seed(BENCHMARK_SEED)
+    np.random.seed(BENCHMARK_SEED)
+    return benchmark.setup(L, density, np.random.default_rng(BENCHMARK_SEED))
+
+
+def run_benchmark(name, L, density, repeats=3, memory=True):
+    ''' times one benchmark for one lattice size and density
+
+    the benchmark runs in a temporary working directory (the end to end
+    benchmarks write csv files and figures) with its prints silenced. The
+    setup is repeated before every run since the updates modify the lattice
+
+    Args:
+        name (string): the name of the benchmark, see BENCHMARKS
+        L (int): the number of the lattice sites
+        density (float): the number of particles per site
+        repeats (int): the number of timed runs, the fastest one is kept
+        memory (bool): measure the peak memory in an additional run
+
+    Returns:
+        dictionary of the results of the benchmark
+    '''
+    benchmark = BENCHMARKS[name]
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        os.chdir(directory)
+        try:
+            wall_time = float('inf')
+            for repeat in range(repeats):
+                run, work = seeded_setup(benchmark, L, density)
+                start = time.perf_counter()
+                run()
+                wall_time = min(wall_time, time.perf_counter() - start)
+            peak_memory = None
+            if memory:
+                run, work = seeded_setup(benchmark, L, density)
+                tracemalloc.start()
+                run()
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        finally:
+            os.chdir(working_directory)
+    return {'benchmark': name, 'L': L, 'density': density, 'work': work,
+            'wall_time': wall_time, 'throughput': work/wall_time,
+            'unit': benchmark.unit, 'peak_memory': peak_memory}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(names=None, sizes=SIZES, repeats=3, memory=True):
+    ''' runs the benchmarks for every size up to their max_size and density
+
+    Args:
+        names (list): the names of the benchmarks to run, all by default
+        sizes (list): the lattice sizes
+        repeats (int): the number of timed runs of every benchmark
+        memory (bool): measure the peak memory of the benchmarks
+
+    Returns:
+        dictionary of the metadata of the run and the list of the results
+    '''
+    names = list(BENCHMARKS) if names is None else names
+    results = []
+    for name in names:
+        if name not in BENCHMARKS:
+            print("the benchmark {} has not been implemented".format(name))
+            continue
+        benchmark = BENCHMARKS[name]
+        for L in sizes:
+            if L > benchmark.max_size:
+                continue
+            for density in benchmark.densities:
+                result = run_benchmark(name, L, density, repeats, memory)
+                print("{:<28} L={:<8} density={:<4} {:>10.4f} s {:>12.4g} {}".format(
+                    name, L, density, result['wall_time'], result['throughput'], result['unit']))
+                results.append(result)
+    return {'commit': git_commit(), 'seed': BENCHMARK_SEED, 'python': platform.python_version(),
+            'numpy': np.__version__, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results}
+
+
+def compare_runs(baseline, candidate, threshold=0.1):
+    ''' compares two runs of the suite and finds the regressions
+
+    a benchmark (of a given size and density) regressed if its wall time or
+    its peak memory grew by more than threshold relative to the baseline
+
+    Args:
+        baseline (dict): a run of the suite as written by run_suite
+        candidate (dict): a later run of the suite
+        threshold (float): the tolerated relative growth
+
+    Returns:
+        list of the descriptions of the regressions
+    '''
+    key = lambda result: (result['benchmark'], result['L'], result['density'])
+    baseline_results = {key(result): result for result in baseline['results']}
+    regressions = []
+    for result in candidate['results']:
+        reference = baseline_results.get(key(result))
+        if reference is None:
+            continue
+        ratio = result['wall_time']/reference['wall_time']
+        line = "{:<28} L={:<8} density={:<4} time x{:.2f}".format(*(key(result) + (ratio,)))
+        regressed = ratio > 1 + threshold
+        if result['peak_memory'] and reference['peak_memory']:
+            memory_ratio = float(result['peak_memory'])/reference['peak_memory']
+            line += " memory x{:.2f}".format(memory_ratio)
+            regressed = regressed or memory_ratio > 1 + threshold
+        if regressed:
+            regressions.append(line)
+        print(line)
+    return regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='benchmarks of the models, the compression and the sweep')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the benchmarks and write their results as json')
+    run_parser.add_argument('--output', default='benchmarks.json')
+    run_parser.add_argument('--benchmarks', nargs='+', choices=sorted(BENCHMARKS))
+    run_parser.add_argument('--sizes', nargs='+', type=int, default=SIZES)
+    run_parser.add_argument('--repeats', type=int, default=3)
+    run_parser.add_argument('--no-memory', action='store_true')
+    compare_parser = commands.add_parser('compare', help='flag the regressions of a run against a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=0.1)
+    arguments = parser.parse_args(arguments)
+
+    if arguments.command == 'run':
+        run = run_suite(arguments.benchmarks, arguments.sizes, arguments.repeats, not arguments.no_memory)
+        with open(arguments.output, 'w') as output:
+            json.dump(run, output, indent=2)
+        return 0
+    with open(arguments.baseline) as baseline, open(arguments.candidate) as candidate:
+        regressions = compare_runs(json.load(baseline), json.load(candidate), arguments.threshold)
+    if regressions:
+        print("{} regressions above {:.0%}:".format(len(regressions), arguments.threshold))
+        for regression in regressions:
+            print(regression)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
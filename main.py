@@ -1,15 +1,16 @@
-from main.simulator import create_multiple_realizations
-from main.data_analysis_tools import analyze_data,visualize_results
-
 import pandas as pd
 
+from utils.simulator import create_multiple_realizations, create_ensemble, geometric_schedule
+from utils.pipeline import pipelined_realizations
+from utils.data_analysis_tools import visualize_results,RunningStatistics,aggregate_store
+
 N = range(0,20001,1000)
 L = 10000
 T = [50000]
 cores = 32
 model = 'manna'
 
-def run_simulation(L,N,T,cores,model = 'clg'):
+def run_simulation(L,N,T,cores,model = 'clg',batched = False,compressor = 'lz78',store = None,checkpoint = None,seed = None,pipelined = False,tolerance = None):
     # start_time = time.clock()
     # """ perform the simulation according to the given parameters
     #
@@ -25,17 +26,55 @@ def run_simulation(L,N,T,cores,model = 'clg'):
     #      N (list): number of particles
     #      T (list): propagation times
     #      cores (int): the number of different realizations
+    #      batched (bool): propagate all the realizations of a density as one
+    #                      array on a single core instead of one process each
+    #      compressor (str): the compression backend used to compute the cid
+    #      store (str): path of a .npy results store the realizations are
+    #                   written to, kept on disk after the run
+    #      checkpoint (str): directory of the checkpoints of the realizations,
+    #                        rerunning with the same directory resumes the
+    #                        sweep and appending times to T extends it
+    #      seed (int): seed of the random generators of the realizations, the
+    #                  entropy printed at the start of a run reproduces it
+    #      pipelined (bool): measure the snapshots in separate processes while
+    #                        the lattices keep evolving (see utils.pipeline)
+    #      tolerance (float): sample every realization on a geometric schedule
+    #                         up to sum(T) and stop it once its cid is within
+    #                         tolerance of a plateau (or it is absorbed), the
+    #                         mean stop time of every density is printed
+    #                         and the stop time of every realization is
+    #                         written to stop_times.csv.
+    #                         cannot be combined with batched, pipelined,
+    #                         store or checkpoint
     #
     #  Returns:
     #      pandas_DataFrame: the results of the simulation where N are the
     #      columns, T dictates the rows (row i equals sum of first i elements in
     #      T) and each cell holds a list of the CID values for each realization
     # """
-    create_multiple_realizations(L,N,T,cores,model,'cid')
-
-    data = pd.DataFrame(data = analyze_data(N,T,cores,True))
+    if tolerance is not None and (batched or pipelined or store is not None or checkpoint is not None):
+        print("adaptive stopping does not support batched, pipelined, stored or checkpointed runs")
+        return
+    if tolerance is not None:
+        T = geometric_schedule(sum(T))
+    statistics = RunningStatistics(N,T)
+    if tolerance is not None:
+        statistics, stop_times = create_multiple_realizations(L,N,T,cores,model,'cid',compressor,None,None,statistics,
+                                                              seed = seed,tolerance = tolerance)
+        for n_loc,n in enumerate(N):
+            print("density {} stopped after {} updates on average".format(float(n)/L, stop_times[:,n_loc].mean()))
+        pd.DataFrame(stop_times,columns = [str(n) for n in N]).to_csv("stop_times.csv")
+    elif batched:
+        statistics.update_batch(create_ensemble(L,N,T,cores,model,'cid',compressor,seed))
+    elif pipelined:
+        statistics.update_batch(pipelined_realizations(L,N,T,cores,model,'cid',compressor,seed = seed))
+    elif store is None:
+        create_multiple_realizations(L,N,T,cores,model,'cid',compressor,None,None,statistics,checkpoint,seed = seed)
+    else:
+        create_multiple_realizations(L,N,T,cores,model,'cid',compressor,None,store,None,checkpoint,seed = seed)
+        statistics = aggregate_store(store)
 
-    visualize_results(L,N,T,cores,model,data,-0.4,False,False)
+    visualize_results(L,N,T,cores,model,statistics,-0.4,False,False)
 
     #uncomment those lines to compare the dynamical rules of clg
     #results = compare_dynamical_rules(50000,5000,5000)
@@ -0,0 +1,58 @@
+import random
+
+
+class ActiveSiteIndex(object):
+    ''' an indexed set of lattice sites
+
+    This class keeps the active sites of a lattice in a list together with the
+    position of every site inside that list. This allows adding a site,
+    removing a site and choosing a random site in O(1) which makes it possible
+    to update the set of active sites locally after every move instead of
+    rescanning the whole lattice.
+
+    Args:
+        L (int): number of the lattice sites
+        sites (iterable): the initially active sites
+
+    '''
+    def __init__(self, L, sites=()):
+        self.sites = []
+        self.position = [-1] * L
+        for site in sites:
+            self.add(site)
+
+    def __len__(self):
+        return len(self.sites)
+
+    def __contains__(self, site):
+        return self.position[site] >= 0
+
+    def __iter__(self):
+        return iter(self.sites)
+
+    def add(self, site):
+        ''' adds a site to the set if it is not already in it '''
+        if self.position[site] < 0:
+            self.position[site] = len(self.sites)
+            self.sites.append(site)
+
+    def discard(self, site):
+        ''' removes a site from the set by swapping it with the last site '''
+        index = self.position[site]
+        if index < 0:
+            return
+        last = self.sites.pop()
+        if last != site:
+            self.sites[index] = last
+            self.position[last] = index
+        self.position[site] = -1
+
+    def choice(self, rng=None):
+        ''' returns a uniformly chosen site of the set
+
+        the site is drawn with the numpy Generator rng if given and with the
+        random module otherwise
+        '''
+        if rng is None:
+            return self.sites[random.randrange(len(self.sites))]
+        return self.sites[int(rng.random()*len(self.sites))]
@@ -3,6 +3,8 @@
 import numpy as np
 import random
 
+from models.active_set import ActiveSiteIndex
+
 
 ##### Lattice Methods #####
 
@@ -11,10 +13,14 @@ import random
 # Arguments - N is the number of particles
 #             L is the number of sites
 # returns an array with N particles randomly organized on L sites
+# if a numpy Generator rng is given the occupied sites are drawn with a single
+# choice without replacement
 #==============================================================================
-def create_clg_lattice(n,L): #length of the dimension
+def create_clg_lattice(n,L,rng=None): #length of the dimension
     lattice = np.zeros(L)
-    if n < L:
+    if rng is not None and n <= L:
+        lattice[rng.choice(L, n, replace=False)] = 1
+    elif n < L:
         for it in random.sample(range(L), n):
             lattice[it]+=1
     elif n==L:
@@ -24,6 +30,24 @@ def create_clg_lattice(n,L): #length of the dimension
         print("number of particles cant be bigger than the system's size")
     return lattice
 
+#==============================================================================
+# create_clg_ensemble(n,L,R)
+# Arguments - n is the number of particles
+#             L is the number of sites
+#             R is the number of realizations
+# returns an (R,L) array whose rows are independent clg lattices, each with n
+# particles randomly organized on L sites. rng is an optional numpy Generator
+#==============================================================================
+def create_clg_ensemble(n,L,R,rng=None):
+    rng = np.random if rng is None else rng
+    lattices = np.zeros((R,L))
+    if n > L:
+        print("number of particles cant be bigger than the system's size")
+        return lattices
+    occupied_sites = np.argsort(rng.random((R,L)), axis=1)[:,:n]
+    lattices[np.arange(R)[:,None], occupied_sites] = 1
+    return lattices
+
 #### Update Methods ####
 #==============================================================================
 # find_active_sites(lattice):
@@ -61,24 +85,26 @@ def find_empty_neighbor(lattice,site):
 # all such cases by randomly (with equal probabilities) deactivate one of the
 # active competing sites
 # although not utilized it will also return the resulting active sites
+# the coins are flipped with the numpy Generator rng if given
 #==============================================================================
-def fix_competition(active_particles,lattice):
+def fix_competition(active_particles,lattice,rng=None):
+    uniform = (lambda : random.uniform(0,1)) if rng is None else rng.random
     L_a = len(active_particles)
     L = len(lattice)
     active_particles_to_be_deactivated = set()
     for activity_index,particle_loc in enumerate(active_particles):
         if active_particles[(activity_index+1)%L_a] == particle_loc + 2:
-            if (random.uniform(0,1) < 0.5):
+            if (uniform() < 0.5):
                 active_particles_to_be_deactivated.add(particle_loc)
             else:
                 active_particles_to_be_deactivated.add(active_particles[(activity_index+1)%L_a])
     if (0 in active_particles and (L-2) in active_particles):
-        if (random.uniform(0,1) < 0.5):
+        if (uniform() < 0.5):
             active_particles_to_be_deactivated.add(0)
         else:
             active_particles_to_be_deactivated.add(L-2)
     if (1 in active_particles and L-1 in active_particles):
-        if (random.uniform(0,1) < 0.5):
+        if (uniform() < 0.5):
             active_particles_to_be_deactivated.add(1)
         else:
             active_particles_to_be_deactivated.add(L-1)
@@ -92,25 +118,252 @@ def fix_competition(active_particles,lattice):
 # if two active sites are competing over the same empty neighbor one will be
 # randomly chosen
 # will make a total number of timesteps updates to the lattice
+# returns True if the lattice has been absorbed i.e no active site was left
+# if activity is a preallocated array of at least timesteps values, the
+# activity before every timestep, read from the active sites found anyway, is
+# written into it. the random choices are made with the numpy Generator rng if
+# given
 #==============================================================================
-def parallel_update(lattice,timesteps=1,randomize=False):
+def parallel_update(lattice,timesteps=1,randomize=False,activity=None,rng=None):
     L = len(lattice)
     for t in range(timesteps):
         active_sites = find_active_sites(lattice)
+        if activity is not None:
+            activity[t] = float(len(active_sites))/L
 
         if (len(active_sites) == 0):
-            break
+            if activity is not None:
+                activity[t:timesteps] = 0.0
+            return True
         if randomize:
-            active_site = random.choice(active_sites)
+            active_site = random.choice(active_sites) if rng is None else active_sites[rng.integers(len(active_sites))]
             lattice[active_site] -= 1
             lattice[(active_site+(find_empty_neighbor(lattice,active_site)))%L] += 1
 
         else:
-            fix_competition(active_sites,lattice)
+            fix_competition(active_sites,lattice,rng)
             for active_site in active_sites:
                 ## assumes competion is resolved -> displace active particles
                 lattice[active_site] -= 1
                 lattice[(active_site+(find_empty_neighbor(lattice,active_site)))%L] += 1
+    return False
+
+#==============================================================================
+# is_active_site(lattice,site)
+# single site version of find_active_sites, used to update the active sites
+# locally after a particle has moved
+#==============================================================================
+def is_active_site(lattice,site):
+    L = len(lattice)
+    if lattice[site] != 1.0:
+        return False
+    return (lattice[(site+1)%L]==1.0) ^ (lattice[(site-1)%L]==1.0)
+
+#==============================================================================
+# hop(lattice,active_sites,active_site)
+# moves the particle of an active site to its empty neighbor and updates the
+# ActiveSiteIndex of the lattice. the particle moved to one of the neighbors so
+# only the sites at distance of at most two from the original site may have
+# changed their activity
+#==============================================================================
+def hop(lattice,active_sites,active_site):
+    L = len(lattice)
+    lattice[active_site] -= 1
+    lattice[(active_site+(find_empty_neighbor(lattice,active_site)))%L] += 1
+    for site in range(active_site-2, active_site+3):
+        site %= L
+        if is_active_site(lattice,site):
+            active_sites.add(site)
+        else:
+            active_sites.discard(site)
+
+#==============================================================================
+# create_active_site_index(lattice,sites)
+# returns the ActiveSiteIndex of the active sites of a lattice, in ascending
+# order or in the order of sites if it is given (as saved by a checkpoint)
+#==============================================================================
+def create_active_site_index(lattice,sites=None):
+    if sites is None:
+        sites = np.flatnonzero(find_active_mask(lattice)).tolist()
+    return ActiveSiteIndex(len(lattice), sites)
+
+#==============================================================================
+# random_sequential_update(lattice,timesteps)
+# equivalent to parallel_update(lattice,timesteps,True) without rescanning the
+# lattice every timestep. the active sites are kept in an ActiveSiteIndex which
+# allows an O(1) random choice. after each hop only the sites around the
+# vacated and the occupied sites are re-examined, making a timestep O(1)
+# instead of O(L). returns True if the lattice has been absorbed.
+# if activity is a preallocated array of at least timesteps values, the
+# activity before every timestep is written into it. it is read from the size
+# of the active sites index so recording costs O(1) per timestep.
+# the active particles are chosen with the numpy Generator rng if given.
+# the index is built from the lattice unless the ActiveSiteIndex active_sites
+# of the lattice is given. the order of its sites, on which the chosen
+# particles depend, is kept when the caller passes the same index to the next
+# call, so the timesteps split over several calls draw the same hops as one call
+#==============================================================================
+def random_sequential_update(lattice,timesteps=1,activity=None,rng=None,active_sites=None):
+    L = len(lattice)
+    if active_sites is None:
+        active_sites = create_active_site_index(lattice)
+    for t in range(timesteps):
+        if activity is not None:
+            activity[t] = float(len(active_sites))/L
+        if (len(active_sites) == 0):
+            if activity is not None:
+                activity[t:timesteps] = 0.0
+            break
+        hop(lattice,active_sites,active_sites.choice(rng))
+    return len(active_sites) == 0
+
+#==============================================================================
+# gillespie_clg_update(lattice,duration)
+# event driven, continuous time version of random_sequential_update. every
+# active particle hops with rate 1, so the time to the next hop is exponential
+# with a rate equal to the number of active sites and the hopping particle is
+# a uniformly chosen active one. the lattice is propagated for duration units
+# of time (one unit is one attempted hop per active particle on average) and
+# the work is proportional to the number of hops, independent of L, which
+# makes it efficient close to the absorbing transition where only a few sites
+# are active. returns True if the lattice has been absorbed. the waiting times
+# and the hopping particles are drawn with the numpy Generator rng if given
+#==============================================================================
+def gillespie_clg_update(lattice,duration=1.0,rng=None):
+    active_sites = create_active_site_index(lattice)
+    time = 0.0
+    while (len(active_sites) > 0):
+        if rng is None:
+            time += random.expovariate(len(active_sites))
+        else:
+            time += rng.exponential(1.0/len(active_sites))
+        if (time > duration):
+            return False
+        hop(lattice,active_sites,active_sites.choice(rng))
+    return True
+
+#==============================================================================
+# batched_random_sequential_update(lattices,timesteps)
+# random sequential update of an (R,L) ensemble of lattices. every timestep a
+# random active particle of each lattice which still has active sites hops to
+# its empty neighbor. the active sites of every lattice are kept in the rows
+# of an array, with the position of every site in its row, i.e an
+# ActiveSiteIndex per lattice whose operations are applied to all the lattices
+# at once. the hopping particle is picked by drawing an index below the number
+# of active sites of its row and only the five sites around it are re-examined
+# after the hop, so a timestep is O(R) instead of O(R*L) (the index is built
+# once per call in O(R*L)). returns True if all the lattices have been
+# absorbed. if activity is a preallocated array of shape (timesteps,R) the
+# activity of every lattice before every timestep is written into it. rng is
+# an optional numpy Generator, a freshly seeded one is used if it is not given
+#==============================================================================
+def batched_random_sequential_update(lattices,timesteps=1,activity=None,rng=None):
+    rng = np.random.default_rng() if rng is None else rng
+    R, L = lattices.shape
+    active = find_active_mask(lattices)
+    counts = active.sum(axis=1)
+    # the active sites first in every row, position is -1 for inactive sites
+    sites = np.argsort(~active, axis=1, kind='stable')
+    position = np.full((R,L), -1, dtype=np.int64)
+    np.put_along_axis(position, sites, np.where(np.take_along_axis(active, sites, axis=1), np.arange(L), -1), axis=1)
+    for t in range(timesteps):
+        if activity is not None:
+            activity[t] = counts/float(L)
+        rows = np.flatnonzero(counts)
+        if (len(rows) == 0):
+            if activity is not None:
+                activity[t:timesteps] = 0.0
+            return True
+        active_sites = sites[rows,rng.integers(0, counts[rows])]
+        # an active particle whose right neighbor is occupied moves to the left
+        directions = np.where(lattices[rows,(active_sites+1)%L]==1.0, -1, 1)
+        lattices[rows,active_sites] -= 1
+        lattices[rows,(active_sites+directions)%L] += 1
+        for shift in range(-2, 3):
+            site = (active_sites+shift)%L
+            is_active = (lattices[rows,site]==1.0) & ((lattices[rows,(site+1)%L]==1.0) ^ (lattices[rows,(site-1)%L]==1.0))
+            indexed = position[rows,site] >= 0
+            added, added_sites = rows[is_active & ~indexed], site[is_active & ~indexed]
+            sites[added,counts[added]] = added_sites
+            position[added,added_sites] = counts[added]
+            counts[added] += 1
+            # a discarded site is replaced by the last active site of its row
+            removed, removed_sites = rows[~is_active & indexed], site[~is_active & indexed]
+            counts[removed] -= 1
+            last_sites = sites[removed,counts[removed]]
+            sites[removed,position[removed,removed_sites]] = last_sites
+            position[removed,last_sites] = position[removed,removed_sites]
+            position[removed,removed_sites] = -1
+    return False
 
 def clg_activity(lattice):
     return float(len(find_active_sites(lattice)))/len(lattice)
+
+#==============================================================================
+# ensemble_clg_activity(lattices)
+# returns the activity of every row of an (R,L) ensemble of lattices
+#==============================================================================
+def ensemble_clg_activity(lattices):
+    return find_active_mask(lattices).mean(axis=-1)
+
+#### Vectorized Update Methods ####
+# the functions above are kept as the reference implementation, the functions
+# below perform the same dynamics with whole-array operations and are the ones
+# to use for large lattices
+
+#==============================================================================
+# find_active_mask(lattice)
+# vectorized counterpart of find_active_sites. a site is active if it is
+# occupied and exactly one of its neighbors is occupied. the neighbors are
+# found by rolling the lattice along its last axis
+# returns a boolean array of the same shape as the lattice
+#==============================================================================
+def find_active_mask(lattice):
+    occupied = lattice == 1
+    right_occupied = np.roll(occupied, -1, axis=-1)
+    left_occupied = np.roll(occupied, 1, axis=-1)
+    return occupied & (right_occupied ^ left_occupied)
+
+#==============================================================================
+# vectorized_parallel_update(lattice,timesteps)
+# vectorized counterpart of parallel_update(lattice,timesteps,False).
+# every active particle hops towards its empty neighbor. when two active
+# particles compete over the same empty site a single batched array of coin
+# flips decides which one of them stays put. all the winners are then moved
+# in one scatter. the moves are computed from the configuration at the
+# beginning of each timestep i.e the update is fully synchronous. note that
+# unlike fix_competition, two active particles which are two sites apart but
+# move away from each other (as in 01110) are not considered as competing,
+# and the particle of site L-1 always reads site 0 before the update, whereas
+# parallel_update has already moved the particle of site 0 when it reaches
+# site L-1, so the two updates differ when both of these sites are active.
+# returns True if the lattice (all the lattices of an ensemble) has been absorbed.
+# if activity is a preallocated array of at least timesteps values (of shape
+# (timesteps,R) for an ensemble) the activity before every timestep, which is
+# read from the active sites mask the update computes anyway, is written into it.
+# the coin flips are drawn with the numpy Generator rng if given
+#==============================================================================
+def vectorized_parallel_update(lattice,timesteps=1,activity=None,rng=None):
+    rng = np.random if rng is None else rng
+    for t in range(timesteps):
+        active = find_active_mask(lattice)
+        if activity is not None:
+            activity[t] = active.mean(axis=-1)
+        if not active.any():
+            if activity is not None:
+                activity[t:timesteps] = 0.0
+            return True
+        # an active particle whose right neighbor is occupied moves to the left
+        move_left = active & np.roll(lattice == 1, -1, axis=-1)
+        move_right = active & ~move_left
+
+        # an empty site targeted from both sides is a competition
+        competition = np.roll(move_right, 1, axis=-1) & np.roll(move_left, -1, axis=-1)
+        coins = rng.random(lattice.shape) < 0.5
+        move_right &= ~np.roll(competition & coins, -1, axis=-1)
+        move_left &= ~np.roll(competition & ~coins, 1, axis=-1)
+
+        targets = np.roll(move_right, 1, axis=-1) | np.roll(move_left, -1, axis=-1)
+        lattice[move_right | move_left] = 0
+        lattice[targets] = 1
+    return False
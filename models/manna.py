@@ -3,33 +3,59 @@
 import numpy as np
 import random
 
+from models.active_set import ActiveSiteIndex
+
 
 ##### Lattice Methods #####
 
 
-def create_manna_lattice(n,L):
+def create_manna_lattice(n,L,rng=None):
     ''' creates a manna lattice of L sites and N particles
 
     This function creates a manna lattice with particles randomly distributed
     among its sites. The distribution process is implement through randomly
     choosing a site and adding it a particle for a total number of N (number of
-    particles) times.
+    particles) times. If a numpy Generator rng is given all the sites are
+    drawn at once and counted with bincount.
 
     Args:
         L (int): number of the lattice sites
         N (int): number of particles
+        rng (numpy Generator): the random number generator
 
 
     Returns:
         numpy array of a manna lattice with N randomly distributed particles
 
     '''
+    if rng is not None:
+        return np.bincount(rng.integers(0, L, size=n), minlength=L).astype(float)
     lattice = np.zeros(L)
     for particle in range(n):
         particle_loc = random.randint(0,L-1)
         lattice[particle_loc] += 1
     return lattice
 
+def create_manna_ensemble(n,L,R,rng=None):
+    ''' creates an ensemble of R manna lattices of L sites and N particles
+
+    The particles of all the lattices are placed at once by drawing a random
+    site for each one of them and counting the draws of every row.
+
+    Args:
+        n (int): number of particles in each lattice
+        L (int): number of the lattice sites
+        R (int): number of realizations
+        rng (numpy Generator): the random number generator
+
+    Returns:
+        (R,L) numpy array whose rows are independent manna lattices
+
+    '''
+    rng = np.random if rng is None else rng
+    particle_locs = (rng.random((R,n))*L).astype(np.int64) + L*np.arange(R)[:,None]
+    return np.bincount(particle_locs.ravel(), minlength=R*L).reshape(R,L).astype(float)
+
 def count_particles(lattice):
     ''' counts the number particles in a lattice
 
@@ -89,7 +115,7 @@ def parallel_manna_update(lattice,timesteps=1, z = 0, only_excess_are_active=Fal
         Z (int) :  threshold value for the activity of a site
 
     Returns:
-        None
+        True if the lattice has been absorbed i.e no active site was left
 
     '''
     if (z == 0):
@@ -102,7 +128,7 @@ def parallel_manna_update(lattice,timesteps=1, z = 0, only_excess_are_active=Fal
         active_sites = find_active_sites(lattice, z)
 
         if (len(active_sites) == 0):
-            break
+            return True
         non_excess_activity = only_excess_are_active
         # if randomized_non_excess:
         #     non_excess_activity *= np.random.randint(z)
@@ -114,6 +140,133 @@ def parallel_manna_update(lattice,timesteps=1, z = 0, only_excess_are_active=Fal
             lattice[active_site] -= particles_to_the_right + particles_to_the_left
             lattice[(active_site+1)%L] += particles_to_the_right
             lattice[(active_site-1)%L] += particles_to_the_left
+    return False
+
+def vectorized_manna_update(lattice, timesteps=1, z=0, only_excess_are_active=False, randomized_non_excess=False, binomial=True, activity=None, mass=None, rng=None):
+    ''' updates all the lattice sites in parallel using array operations
+
+    This function is the vectorized counterpart of parallel_manna_update. The
+    active sites of a whole timestep are found with a single comparison, the
+    number of particles each active site sends to the right is drawn for all of
+    them at once and the transfers are applied by rolling the lattice. By
+    default every displaced particle independently chooses a neighbor, i.e.
+    the right-moving counts are binomial. Passing binomial=False draws them
+    uniformly as parallel_manna_update does. The updates take place on the
+    provided lattice and not on a copy of it. The density of active sites and
+    of the particles on them before every timestep can be recorded into
+    preallocated arrays, they are read from the active sites of the timestep
+    so recording them does not require another scan of the lattice
+
+    Args:
+        lattice (numpy array): the manna lattice
+        timesteps (int): the number of updates to be performed
+        Z (int) :  threshold value for the activity of a site
+        only_excess_are_active (bool): keep Z particles at the toppling sites
+        randomized_non_excess (bool): randomize the number of kept particles
+        binomial (bool): binomial instead of uniform redistribution
+        activity (numpy array): at least timesteps values (of shape
+            (timesteps,R) for an ensemble) receiving the density of active sites
+        mass (numpy array): same as activity, receiving the density of the
+            particles on the active sites (as manna_activity)
+        rng (numpy Generator): the random number generator
+
+    Returns:
+        True if the lattice (all the lattices of an ensemble) has been absorbed
+
+    '''
+    if (z == 0):
+        print("Z is the threshold value for activity and it cannot be less than 1")
+        return
+
+    rng = np.random if rng is None else rng
+    for t in range(timesteps):
+        active = lattice > z
+        if activity is not None:
+            activity[t] = active.mean(axis=-1)
+        if mass is not None:
+            mass[t] = np.where(active, lattice, 0).mean(axis=-1)
+        if not active.any():
+            for record in (activity, mass):
+                if record is not None:
+                    record[t:timesteps] = 0.0
+            return True
+        # one effective threshold per timestep (and per lattice of an ensemble)
+        noise = rng.random(lattice.shape[:-1] + (1,))
+        z_eff = np.round((only_excess_are_active-randomized_non_excess*noise)*z)
+        moving = np.where(active, lattice - z_eff, 0).astype(np.int64)
+        if binomial:
+            particles_to_the_right = rng.binomial(moving, 0.5)
+        else:
+            particles_to_the_right = (rng.random(lattice.shape)*(moving + 1)).astype(np.int64)
+        particles_to_the_left = moving - particles_to_the_right
+
+        lattice -= moving
+        lattice += np.roll(particles_to_the_right, 1, axis=-1)
+        lattice += np.roll(particles_to_the_left, -1, axis=-1)
+    return False
+
+def gillespie_manna_update(lattice, duration=1.0, z=0, only_excess_are_active=False, randomized_non_excess=False, binomial=True, rng=None):
+    ''' propagates the lattice in continuous time, one toppling at a time
+
+    This function is an event driven (Gillespie) version of the manna update.
+    Every active site topples with rate 1, so the time to the next toppling is
+    exponential with a rate equal to the number of active sites, and the
+    toppling site is chosen uniformly among them. The active sites are kept in
+    an ActiveSiteIndex which is updated locally after every toppling, so the
+    work is proportional to the number of topplings and not to the size of
+    the lattice. The particles of a toppling site are redistributed as in
+    vectorized_manna_update
+
+    Args:
+        lattice (numpy array): the manna lattice
+        duration (float): the time the lattice is propagated for
+        Z (int) :  threshold value for the activity of a site
+        only_excess_are_active (bool): keep Z particles at the toppling sites
+        randomized_non_excess (bool): randomize the number of kept particles
+        binomial (bool): binomial instead of uniform redistribution
+        rng (numpy Generator): the random number generator, the random module
+            is used if it is not given
+
+    Returns:
+        True if the lattice has been absorbed i.e no active site was left
+
+    '''
+    if (z == 0):
+        print("Z is the threshold value for activity and it cannot be less than 1")
+        return
+
+    L = len(lattice)
+    active_sites = ActiveSiteIndex(L, np.flatnonzero(lattice > z).tolist())
+    time = 0.0
+    while (len(active_sites) > 0):
+        if rng is None:
+            time += random.expovariate(len(active_sites))
+            noise = random.random()
+        else:
+            time += rng.exponential(1.0/len(active_sites))
+            noise = rng.random()
+        if (time > duration):
+            return False
+        active_site = active_sites.choice(rng)
+        z_eff = int(np.round((only_excess_are_active-randomized_non_excess*noise)*z))
+        moving = int(lattice[active_site]) - z_eff
+        if binomial:
+            particles_to_the_right = (np.random if rng is None else rng).binomial(moving, 0.5)
+        elif rng is None:
+            particles_to_the_right = random.randint(0, moving)
+        else:
+            particles_to_the_right = int(rng.random()*(moving + 1))
+
+        lattice[active_site] -= moving
+        lattice[(active_site+1)%L] += particles_to_the_right
+        lattice[(active_site-1)%L] += moving - particles_to_the_right
+        for site in (active_site-1, active_site, active_site+1):
+            site %= L
+            if lattice[site] > z:
+                active_sites.add(site)
+            else:
+                active_sites.discard(site)
+    return True
 
 def manna_activity(lattice,Z, all_particles=True):
     ''' returns the activity of the manna lattice as a fraction of its active
@@ -127,3 +280,16 @@ def manna_activity(lattice,Z, all_particles=True):
     if all_particles:
         return np.sum([lattice[x] for x in find_active_sites(lattice, Z)])/len(lattice)
     return float(len(find_active_sites(lattice,Z)))/len(lattice)
+
+def ensemble_manna_activity(lattices, Z, all_particles=True):
+    ''' returns the activity of every row of an ensemble of manna lattices
+
+    Args:
+        lattices (numpy array) : (R,L) ensemble of manna lattices
+    Returns:
+        numpy array of the density of active sites of each lattice
+    '''
+    active = lattices > Z
+    if all_particles:
+        return np.where(active, lattices, 0).sum(axis=-1)/lattices.shape[-1]
+    return active.mean(axis=-1)
@@ -0,0 +1,158 @@
+#### Bit-Packed Chain CLG Model ####
+
+import numpy as np
+import random
+
+
+#==============================================================================
+# a clg site is either empty or occupied, so a lattice of L sites is stored as
+# ceil(L/64) little endian 64 bit words where site i is bit i%64 of word i//64.
+# neighbors are found by shifting whole words (carrying the bit crossing the
+# word boundary) and the activity rule is evaluated with bitwise operations on
+# all the sites of a word at once. the bits past site L-1 are always zero.
+# the words of an (R,L) ensemble are stored as an (R,ceil(L/64)) array
+#==============================================================================
+WORD = 64
+
+#==============================================================================
+# get_bit(words,site) / set_bit(words,site,bits)
+# reads / writes the bit of a site (of every lattice of an ensemble)
+#==============================================================================
+def get_bit(words,site):
+    return (words[...,site//WORD] >> np.uint64(site%WORD)) & np.uint64(1)
+
+def set_bit(words,site,bits):
+    mask = np.uint64(1) << np.uint64(site%WORD)
+    words[...,site//WORD] = (words[...,site//WORD] & ~mask) | (bits.astype(np.uint64) << np.uint64(site%WORD))
+
+#==============================================================================
+# site_mask(L)
+# returns the words with the bits of the L sites set and the padding cleared
+#==============================================================================
+def site_mask(L):
+    mask = np.full((L+WORD-1)//WORD, np.uint64(2**WORD-1), dtype=np.uint64)
+    if L%WORD:
+        mask[-1] = np.uint64((1 << (L%WORD)) - 1)
+    return mask
+
+#==============================================================================
+# right_neighbors(words,L) / left_neighbors(words,L)
+# returns words whose bit i holds the bit of site (i+1)%L / (i-1)%L
+#==============================================================================
+def right_neighbors(words,L):
+    shifted = (words >> np.uint64(1)) | (np.roll(words,-1,axis=-1) << np.uint64(WORD-1))
+    set_bit(shifted,L-1,get_bit(words,0))
+    return shifted & site_mask(L)
+
+def left_neighbors(words,L):
+    shifted = (words << np.uint64(1)) | (np.roll(words,1,axis=-1) >> np.uint64(WORD-1))
+    set_bit(shifted,0,get_bit(words,L-1))
+    return shifted & site_mask(L)
+
+#==============================================================================
+# popcount(words)
+# returns the number of set bits along the last axis
+#==============================================================================
+def popcount(words):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=-1)
+    return np.unpackbits(words.view(np.uint8), axis=-1).sum(axis=-1)
+
+
+class PackedCLGLattice(object):
+    ''' a clg lattice (or an ensemble of lattices) stored as packed bits
+
+    Args:
+        words (numpy array): the uint64 words of the lattice
+        L (int): number of the lattice sites
+
+    '''
+    def __init__(self, words, L):
+        self.words = words
+        self.L = L
+
+    @classmethod
+    def from_lattice(cls, lattice):
+        ''' packs a lattice (or an (R,L) ensemble) created by models.clg '''
+        L = lattice.shape[-1]
+        bits = np.packbits(lattice == 1, axis=-1, bitorder='little')
+        padding = [(0, 0)]*(bits.ndim-1) + [(0, -bits.shape[-1] % 8)]
+        words = np.pad(bits, padding).view('<u8').astype(np.uint64)
+        return cls(words, L)
+
+    def to_lattice(self):
+        ''' unpacks the lattice into the float array used by models.clg '''
+        return np.unpackbits(self.packed_bytes(), axis=-1, count=self.L,
+                             bitorder='little').astype(float)
+
+    def packed_bytes(self):
+        ''' the sites packed 8 per byte (as observables.encoding packs them) '''
+        return self.words.astype('<u8').view(np.uint8)[..., :(self.L+7)//8]
+
+    def active_words(self):
+        ''' the words of the active sites, see models.clg.find_active_mask '''
+        return self.words & (right_neighbors(self.words,self.L) ^ left_neighbors(self.words,self.L))
+
+    def activity(self):
+        return popcount(self.active_words())/float(self.L)
+
+    def parallel_update(self, timesteps=1, activity=None, rng=None):
+        ''' bitwise counterpart of models.clg.vectorized_parallel_update
+
+        every active particle hops towards its empty neighbor and competitions
+        over an empty site are resolved by a word of random coin flips. The
+        whole timestep is computed with shifts and bitwise operations on the
+        packed words
+
+        Args:
+            timesteps (int): the number of updates to be performed
+            activity (numpy array): receives the activity before every update
+            rng (numpy Generator): the random number generator
+
+        Returns:
+            True if the lattice (all the lattices of an ensemble) has been absorbed
+        '''
+        L = self.L
+        rng = np.random if rng is None else rng
+        for t in range(timesteps):
+            words = self.words
+            right_occupied = right_neighbors(words,L)
+            active = words & (right_occupied ^ left_neighbors(words,L))
+            if activity is not None:
+                activity[t] = popcount(active)/float(L)
+            if not active.any():
+                if activity is not None:
+                    activity[t:timesteps] = 0.0
+                return True
+            # an active particle whose right neighbor is occupied moves to the left
+            move_left = active & right_occupied
+            move_right = active & ~right_occupied
+
+            # an empty site targeted from both sides is a competition
+            competition = left_neighbors(move_right,L) & right_neighbors(move_left,L)
+            coins = np.frombuffer(rng.bytes(words.nbytes), dtype=np.uint64).reshape(words.shape)
+            move_right &= ~right_neighbors(competition & coins,L)
+            move_left &= ~left_neighbors(competition & ~coins,L)
+
+            self.words = (words & ~(move_right | move_left)) | left_neighbors(move_right,L) \
+                         | right_neighbors(move_left,L)
+        return False
+
+
+#==============================================================================
+# create_packed_clg_lattice(n,L)
+# returns a PackedCLGLattice with n particles randomly organized on L sites,
+# the bits are set directly so the lattice is never unpacked. rng is an optional
+# numpy Generator
+#==============================================================================
+def create_packed_clg_lattice(n,L,rng=None):
+    if n > L:
+        print("number of particles cant be bigger than the system's size")
+        return
+    words = np.zeros((L+WORD-1)//WORD, dtype=np.uint64)
+    if rng is None:
+        sites = np.array(random.sample(range(L), n), dtype=np.int64)
+    else:
+        sites = rng.choice(L, n, replace=False).astype(np.int64)
+    np.bitwise_or.at(words, sites//WORD, np.uint64(1) << (sites%WORD).astype(np.uint64))
+    return PackedCLGLattice(words, L)
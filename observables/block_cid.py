@@ -0,0 +1,202 @@
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from models.clg import create_clg_lattice
+from observables.compression import COMPRESSORS, compression_cost, random_reference, flatten_manna_configuration, cid
+from observables.encoding import as_symbols
+
+
+#==============================================================================
+# block estimate of the cid of very large lattices. the encoded configuration
+# is split into consecutive blocks of block_length sites which are compressed
+# concurrently and the cid is the total cost of the blocks over the total cost
+# of random blocks of the same lengths, i.e every block is normalized exactly
+# as cid normalizes a whole configuration. the blocks are either independent
+# or, with overlap > 0, every block is compressed after the overlap sites
+# preceding it and costs the difference between the cost with and without it,
+# which recovers part of the patterns a block shares with its neighbors.
+# zlib, bz2 and lzma release the GIL so their blocks are compressed by a pool
+# of threads, the pure python lz78 and lz77 parsers need a pool of processes.
+# within a worker of a sweep the blocks are compressed serially or by a thread
+# pool shared by all the measurements of the process (see shared_executor).
+# the estimate converges to the full cid as block_length grows, block_scaling
+# and block_bias measure how fast for a given lattice or density
+#==============================================================================
+
+DEFAULT_BLOCK_LENGTH = 2**16
+
+# compressors whose C implementation releases the GIL while compressing
+GIL_RELEASING_COMPRESSORS = ('zlib', 'bz2', 'lzma')
+
+
+def block_cost(block, context, compressor='lz78'):
+    ''' the cost of a block, conditioned on the preceding context if given '''
+    if len(context) == 0:
+        return compression_cost(block, compressor)
+    return compression_cost(np.concatenate([context, block]), compressor) - compression_cost(context, compressor)
+
+
+def reference_cost(length, context_length, alphabet_size=2, compressor='lz78'):
+    ''' the cost of a random block of length after a random context '''
+    if context_length == 0:
+        return random_reference(length, alphabet_size, compressor=compressor)
+    return (random_reference(context_length + length, alphabet_size, compressor=compressor)
+            - random_reference(context_length, alphabet_size, compressor=compressor))
+
+
+def split_blocks(symbols, block_length=DEFAULT_BLOCK_LENGTH, overlap=0):
+    ''' splits symbols into blocks of block_length and their contexts
+
+    a last block shorter than half of block_length is merged into the
+    previous one so that no block is dominated by its boundary
+
+    Returns:
+        list of (block, context) pairs of numpy arrays
+    '''
+    starts = list(range(0, len(symbols), block_length))
+    if len(starts) > 1 and len(symbols) - starts[-1] < block_length//2:
+        starts.pop()
+    ends = starts[1:] + [len(symbols)]
+    return [(symbols[start:end], symbols[max(0, start - overlap):start]) for start, end in zip(starts, ends)]
+
+
+_shared_executor = None
+
+
+def shared_executor(compressor):
+    ''' the executor of the block cid measured inside the worker of a sweep
+
+    returns a thread pool created once per process and reused by all the
+    measurements for the compressors which release the GIL, and 'serial'
+    for the others since a pool of processes cannot be started within a worker
+    '''
+    global _shared_executor
+    if compressor not in GIL_RELEASING_COMPRESSORS:
+        return 'serial'
+    if _shared_executor is None:
+        _shared_executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+    return _shared_executor
+
+
+def make_executor(executor='thread', workers=None):
+    if executor == 'thread':
+        return ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+    if executor == 'process':
+        return ProcessPoolExecutor(max_workers=workers)
+    print("the executor {} has not been implemented".format(executor))
+
+
+def block_cid(configuration, model='clg', block_length=DEFAULT_BLOCK_LENGTH, overlap=0, compressor='zlib',
+              executor=None, workers=None):
+    ''' estimates the cid of a configuration from concurrently compressed blocks
+
+    Args:
+        configuration (numpy array): the microstate of a system, either as a
+            lattice, a string or a buffer from observables.encoding
+        model (string): the name of the model implemented on that system
+        block_length (int): the number of sites of a block
+        overlap (int): the number of preceding sites every block is
+            compressed after, the blocks are independent if 0
+        compressor (string): the name of the compression backend
+        executor: 'thread', 'process', 'serial' or a concurrent.futures
+            Executor which is reused and not shut down. By default threads are
+            used for the compressors which release the GIL and processes
+            otherwise, 'serial' compresses the blocks in the calling thread
+        workers (int): the number of threads or processes of a new executor
+
+    Returns:
+        float of the block estimate of the Computable Information Density
+    '''
+    if compressor not in COMPRESSORS:
+        print("the compressor {} has not been registered".format(compressor))
+        return
+    if model == 'clg':
+        symbols = as_symbols(configuration)
+    elif model == 'manna':
+        symbols = as_symbols(flatten_manna_configuration(configuration))
+    else:
+        print("a compression scheme for {} has not been implemented".format(model))
+        return
+    blocks = split_blocks(symbols, block_length, overlap)
+
+    if executor is None:
+        executor = 'thread' if compressor in GIL_RELEASING_COMPRESSORS else 'process'
+    if len(blocks) == 1 or executor == 'serial':
+        costs = [block_cost(block, context, compressor) for block, context in blocks]
+    elif isinstance(executor, Executor):
+        costs = list(executor.map(block_cost, *zip(*blocks), [compressor]*len(blocks)))
+    else:
+        pool = make_executor(executor, workers)
+        if pool is None:
+            return
+        with pool:
+            costs = list(pool.map(block_cost, *zip(*blocks), [compressor]*len(blocks)))
+
+    if model == 'clg':
+        references = [reference_cost(len(block), len(context), 2, compressor) for block, context in blocks]
+    else:
+        # a manna configuration is normalized by its number of sites as in cid
+        references = [len(block) for block, context in blocks]
+    return float(sum(costs))/sum(references)
+
+
+def block_scaling(configuration, block_lengths, model='clg', overlap=0, compressor='zlib', executor=None, workers=None):
+    ''' measures the finite block length scaling of the block cid
+
+    Args:
+        configuration (numpy array): the microstate of a system
+        block_lengths (list): the block lengths to estimate the cid with
+        model (string): the name of the model implemented on that system
+        overlap (int): the number of preceding sites of every block
+        compressor (string): the name of the compression backend
+        executor: the executor of block_cid
+        workers (int): the number of threads or processes of a new executor
+
+    Returns:
+        pandas Series of the block cid indexed by the block length, with the
+        cid of the whole configuration at the index len(configuration)
+    '''
+    values = {block_length: block_cid(configuration, model, block_length, overlap, compressor, executor, workers)
+              for block_length in block_lengths}
+    values[len(as_symbols(configuration))] = cid(configuration, model, compressor=compressor)
+    return pd.Series(values).sort_index()
+
+
+def block_bias(sizes, density, block_length, samples=4, overlap=0, compressor='zlib', rng=None):
+    ''' checks the bias of the block cid against the full cid
+
+    draws random clg lattices (the reference of an ordered lattice is still
+    random, so the bias of random configurations is the largest one) of every
+    size and compares the block cid to the cid of the whole lattice, which is
+    meant to be run on sizes where the full cid is still affordable before the
+    block cid is used on larger ones
+
+    Args:
+        sizes (list): the lattice sizes
+        density (float): the number of particles per site
+        block_length (int): the number of sites of a block
+        samples (int): the number of lattices of every size
+        overlap (int): the number of preceding sites of every block
+        compressor (string): the compression backend of the blocks and of
+            the full cid
+        rng (numpy Generator): the random number generator
+
+    Returns:
+        pandas DataFrame of the mean full and block cid and of the mean
+        relative bias of every size
+    '''
+    rng = np.random.default_rng() if rng is None else rng
+    rows = []
+    for L in sizes:
+        full, block = [], []
+        for sample in range(samples):
+            lattice = create_clg_lattice(int(L*density), L, rng)
+            full.append(cid(lattice, 'clg', compressor=compressor))
+            block.append(block_cid(lattice, 'clg', block_length, overlap, compressor))
+        full, block = np.array(full), np.array(block)
+        rows.append({'L': L, 'cid': full.mean(), 'block_cid': block.mean(),
+                     'relative_bias': np.mean((block - full)/full)})
+    return pd.DataFrame(rows).set_index('L')
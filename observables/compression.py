@@ -1,4 +1,13 @@
 import numpy as np
+import bz2
+import lzma
+import zlib
+import hashlib
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
+
+from observables.encoding import as_symbols, to_bytes
+from utils.instrumentation import current_recorder
 
 
 def flatten_manna_configuration(configuration):
@@ -7,7 +16,8 @@ def flatten_manna_configuration(configuration):
     states in a manna site can be multiple digits in a 10 base numerical system
     which makes their compression  be somewhat problematic. In order to avoid
     this difficulty this function will take any such number and transform it
-    into the biggest possible one digit integer
+    into the biggest possible one digit integer. The configuration itself is
+    not modified
 
     Args:
         configuration (numpy array): the microstate of a system
@@ -15,11 +25,10 @@ def flatten_manna_configuration(configuration):
     Returns:
         numpy array of an easily compressed configuration
     '''
-    flatten_configuration = configuration
-    for site in range(len(configuration)):
-        if configuration[site] > 9:
-            flatten_configuration[site] = 9
-    return flatten_configuration
+    if isinstance(configuration, (str, bytes, bytearray)) or getattr(configuration, 'dtype', None) == np.uint8:
+        # encoded buffers, possibly of ascii digits (see observables.encoding)
+        configuration = as_symbols(configuration)
+    return np.minimum(configuration, 9)
 
 
 def lz_78(configuration, model = 'clg'):
@@ -29,7 +38,8 @@ def lz_78(configuration, model = 'clg'):
     left to right. Assumes that the configuration is given as a string and was
     tests for configurations which are composed only of 0 or 1 values for each
     character. if there is an extra pattern while reaching the end of the string
-    it will be counted as a different pattern
+    it will be counted as a different pattern. A clg configuration may also be
+    given as bytes or as a uint8 array (see observables.encoding)
 
     Args:
         configuration (numpy array): the microstate of a system
@@ -41,6 +51,8 @@ def lz_78(configuration, model = 'clg'):
     if model == 'clg':
         if (type(configuration) == str):
             str_representation = configuration
+        elif isinstance(configuration, (bytes, bytearray, np.ndarray)):
+            str_representation = ''.join(str(int(x)) for x in as_symbols(configuration))
         else:
             print("ERROR : Configuration Must be passed as a string to the compression algorithm")
             return
@@ -61,46 +73,367 @@ def lz_78(configuration, model = 'clg'):
     return seen_patterns
 
 
-    #=============================================================
+def lz_78_phrase_count(configuration):
+    ''' counts the lz78 patterns of a configuration in linear time
+
+    returns the number of patterns lz_78 would find for the same sequence of
+    symbols. Instead of searching a list of the seen patterns, every pattern is
+    a node of a trie stored in a dictionary keyed by (parent pattern, symbol),
+    so each symbol costs a single dictionary lookup. The configuration may be
+    given as a string, as bytes or as a numpy array of values in [0,255]
+
+    Args:
+        configuration (str, bytes or numpy array): the microstate of a system
+
+    Returns:
+        int the number of different patterns in that microstate
+    '''
+    symbols = to_bytes(configuration)
+
+    trie = {}
+    number_of_patterns = 0
+    current_pattern = 0
+    for symbol in symbols:
+        key = (current_pattern << 8) | symbol
+        next_pattern = trie.get(key)
+        if next_pattern is None:
+            number_of_patterns += 1
+            trie[key] = number_of_patterns
+            current_pattern = 0
+        else:
+            current_pattern = next_pattern
+    if current_pattern:
+        number_of_patterns += 1
+    return number_of_patterns
+
+
+#==============================================================================
 # lz_78_number_of_patterns(configuration)
 # returns the number of different patterns according to the lz_78 function
 #==============================================================================
 def lz_78_number_of_patterns(configuration,model = 'clg'):
-    return len(lz_78(configuration,model))
+    if model == 'manna':
+        configuration = flatten_manna_configuration(configuration)
+    return lz_78_phrase_count(configuration)
+
+
+# shortest match found through the index of lz_77_phrase_count, shorter ones
+# are searched with bytes.find
+LZ77_MIN_MATCH = 8
+
+
+def match_length(symbols, candidate, position, limit):
+    ''' returns the number of symbols, at most limit, matching at candidate and
+    at position, comparing blocks of doubling (and then halving) length '''
+    length = 0
+    step = 1
+    while length < limit:
+        step = min(step, limit - length)
+        if symbols[candidate+length:candidate+length+step] == symbols[position+length:position+length+step]:
+            length += step
+            step *= 2
+        elif step > 1:
+            step //= 2
+        else:
+            break
+    return length
+
+
+def lz_77_phrase_count(configuration, window=4096):
+    ''' counts the phrases of a sliding window lz77 parsing of a configuration
+
+    every phrase is the longest prefix of the remaining configuration, of at
+    most window symbols, that starts inside the last window symbols, followed
+    by one new symbol. The positions are indexed by the LZ77_MIN_MATCH symbols
+    starting at them (sorted once with numpy), so the candidates of a match of
+    at least that length are the preceding positions of the same key within
+    the window, the most recent first, and every candidate is extended in
+    place. Shorter matches are searched with bytes.find, which runs in C. The
+    work per phrase is thus bounded by the window instead of growing with the
+    length of the matches
+
+    Args:
+        configuration (str, bytes or numpy array): the microstate of a system
+        window (int): the number of preceding symbols searched for a match
+
+    Returns:
+        int the number of phrases in that microstate
+    '''
+    symbols = to_bytes(configuration)
+    L = len(symbols)
+    indexed = max(0, L - LZ77_MIN_MATCH + 1)
+    array = np.frombuffer(symbols, dtype=np.uint8).astype(np.uint64)
+    keys = np.zeros(indexed, dtype=np.uint64)
+    for offset in range(LZ77_MIN_MATCH):
+        keys |= array[offset:offset+indexed] << np.uint64(8*offset)
+    # previous[p] is the last position before p with the same key, or -1
+    order = np.argsort(keys, kind='stable')
+    previous = np.full(indexed, -1, dtype=np.int64)
+    same_key = keys[order[1:]] == keys[order[:-1]]
+    previous[order[1:][same_key]] = order[:-1][same_key]
+    previous = previous.tolist()
+
+    position = 0
+    number_of_phrases = 0
+    while position < L:
+        start = max(0, position - window)
+        limit = min(window, L - position)
+        length = 0
+        if position < indexed:
+            candidate = previous[position]
+            while candidate >= start and length < limit:
+                # a candidate is only extended if it beats the longest match so far
+                if symbols[candidate:candidate+length+1] == symbols[position:position+length+1]:
+                    length += 1 + match_length(symbols, candidate+length+1, position+length+1, limit-length-1)
+                candidate = previous[candidate]
+        if length == 0:
+            # no match of LZ77_MIN_MATCH symbols, so the match is shorter
+            match = start
+            shortest = min(limit, LZ77_MIN_MATCH - 1)
+            while length < shortest:
+                match = symbols.find(symbols[position:position+length+1], match, position+length)
+                if match < 0:
+                    break
+                length += 1
+        position += length + 1
+        number_of_phrases += 1
+    return number_of_phrases
+
+
+def zlib_size(configuration):
+    ''' returns the number of bytes of the deflate compressed configuration '''
+    return len(zlib.compress(to_bytes(configuration)))
+
+
+def lzma_size(configuration):
+    ''' returns the number of bytes of the lzma compressed configuration '''
+    symbols = to_bytes(configuration)
+    # the dictionary never needs to be longer than the configuration, a preset
+    # sized one would be allocated and initialized on every call. the hash
+    # chain match finder of preset 1 is an order of magnitude faster than the
+    # binary tree one of the higher presets on the long repeats of a lattice
+    return len(lzma.compress(symbols, format=lzma.FORMAT_RAW,
+                             filters=[{'id': lzma.FILTER_LZMA2, 'preset': 1, 'dict_size': max(4096, len(symbols))}]))
+
+
+def bz2_size(configuration):
+    ''' returns the number of bytes of the bz2 compressed configuration '''
+    return len(bz2.compress(to_bytes(configuration), 9))
+
+
+def entropy_operator(number_of_patterns):
+    ''' returns n*log2(n), the cost in bits of n lempel ziv patterns '''
+    return number_of_patterns*np.log2(number_of_patterns)
+
 
+def compressed_bits(number_of_bytes):
+    ''' returns the cost in bits of a compressed buffer '''
+    return 8.0*number_of_bytes
 
-def cid(configuration, model='clg', random_shuffle=False):
+
+#==============================================================================
+# Compressor(size, cost)
+# a compression backend of the cid. size maps a configuration to the size of
+# its compressed representation (number of patterns or of bytes) and cost maps
+# that size to a number of bits. the cid is the cost of a configuration
+# normalized by the cost of a random reference (or by the number of sites)
+#==============================================================================
+Compressor = namedtuple('Compressor', ['size', 'cost'])
+
+COMPRESSORS = {}
+
+
+def register_compressor(name, size, cost=compressed_bits):
+    ''' registers a compression backend which can then be selected by name
+
+    Args:
+        name (string): the name of the backend
+        size (function): maps a configuration to its compressed size
+        cost (function): maps a compressed size to a number of bits
+
+    Returns:
+        None
+    '''
+    COMPRESSORS[name] = Compressor(size, cost)
+
+
+register_compressor('lz78', lz_78_phrase_count, entropy_operator)
+register_compressor('lz77', lz_77_phrase_count, entropy_operator)
+register_compressor('zlib', zlib_size)
+register_compressor('lzma', lzma_size)
+register_compressor('bz2', bz2_size)
+
+
+def compression_cost(configuration, compressor='lz78'):
+    ''' returns the cost in bits of a configuration according to a backend '''
+    backend = COMPRESSORS[compressor]
+    return backend.cost(backend.size(configuration))
+
+
+#==============================================================================
+# maximal number of random references kept by the reference cache
+#==============================================================================
+REFERENCE_CACHE_SIZE = 256
+
+# seed of the generator of the cached references, so that the normalization
+# of the cid is the same in every process and every run
+REFERENCE_SEED = 0
+
+
+def sample_random_reference(length, alphabet_size=2, distribution=None, samples=1, compressor='lz78', rng=None):
+    ''' computes the compression of random configurations
+
+    draws random configurations of the given length, compresses them and
+    returns the average of their compression cost over the samples (n*log2(n)
+    where n is the number of lz78 patterns by default). If distribution is None the symbols are drawn independently
+    and uniformly from the alphabet, otherwise distribution holds the number of
+    appearances of every symbol and the configurations are random shuffles of
+    those symbols
+
+    Args:
+        length (int): the length of the configuration
+        alphabet_size (int): the number of possible symbols
+        distribution (tuple): the number of appearances of every symbol
+        samples (int): the number of random configurations to average over
+        compressor (string): the name of the compression backend
+        rng (numpy Generator): the random number generator
+
+    Returns:
+        float of the average cost of the random configurations
+    '''
+    rng = np.random.default_rng() if rng is None else rng
+    if distribution is not None:
+        symbols = np.repeat(np.arange(len(distribution), dtype=np.uint8), distribution)
+    references = []
+    for sample in range(samples):
+        if distribution is None:
+            reference = rng.integers(alphabet_size, size=length).astype(np.uint8)
+        else:
+            reference = rng.permutation(symbols)
+        references.append(compression_cost(reference, compressor))
+    return float(np.mean(references))
+
+
+@lru_cache(maxsize=REFERENCE_CACHE_SIZE)
+def cached_random_reference(length, alphabet_size=2, distribution=None, samples=1, compressor='lz78'):
+    ''' least recently used cache of sample_random_reference
+
+    the random reference only depends on the length, the alphabet and the
+    symbol distribution of a configuration, so it is computed once and reused
+    by all the snapshots and realizations which share them. Call it once at
+    the beginning of a sweep to precompute the reference. The configurations
+    are drawn from a generator seeded with REFERENCE_SEED
+    '''
+    return sample_random_reference(length, alphabet_size, distribution, samples, compressor,
+                                   np.random.default_rng(REFERENCE_SEED))
+
+
+def random_reference(length, alphabet_size=2, distribution=None, samples=1, resample=False, compressor='lz78', rng=None):
+    ''' returns the random reference used to normalize the cid
+
+    Args:
+        length (int): the length of the configuration
+        alphabet_size (int): the number of possible symbols
+        distribution (tuple): the number of appearances of every symbol
+        samples (int): the number of random configurations to average over
+        resample (bool): draw a fresh reference instead of the cached one
+        compressor (string): the name of the compression backend
+        rng (numpy Generator): the random number generator of a fresh reference
+
+    Returns:
+        float of the average cost of the random configurations
+    '''
+    if resample:
+        return sample_random_reference(length, alphabet_size, distribution, samples, compressor, rng)
+    return cached_random_reference(length, alphabet_size, distribution, samples, compressor)
+
+
+#==============================================================================
+# memoization of the cid. the values are kept in a bounded least recently used
+# cache keyed by a hash of the encoded configuration (and the cid options), so
+# identical configurations, e.g the snapshots of an absorbed lattice, are never
+# compressed twice
+#==============================================================================
+CID_CACHE_SIZE = 1024
+
+cid_cache = OrderedDict()
+
+
+def configuration_key(symbols):
+    ''' returns a hash of the content of an encoded configuration '''
+    return hashlib.blake2b(to_bytes(symbols), digest_size=16).digest()
+
+
+def cid(configuration, model='clg', random_shuffle=False, reference_samples=1, resample_reference=False, compressor='lz78', packed=False, rng=None):
     ''' computes the cid of a configuration
 
     implemented for two models namely conserved lattice gas and manna model,
     this function computes the Computable Information Density of a configuration
-    by using counting the number of different patterns and inserting them to an
-    entropy operator and normalizing by a random reference
+    by compressing it with one of the registered backends (see COMPRESSORS),
+    by default counting the number of different lz78 patterns and inserting
+    them to an entropy operator, and normalizing by a random reference. The
+    random reference is cached (see random_reference) unless resample_reference
+    is set, in which case the cid itself is not memoized either (see cid_cache)
 
     Args:
-        configuration (numpy array): the microstate of a system
+        configuration (numpy array): the microstate of a system, either as a
+            lattice, a string or a buffer from observables.encoding
         model (string): the name of the model implemented on that system
+        random_shuffle (bool): normalize a manna configuration by a random
+            shuffle of its sites
+        reference_samples (int): number of random configurations averaged in
+            the random reference
+        resample_reference (bool): draw a new random reference for every call
+        compressor (string): the name of the compression backend
+        packed (bool): the configuration is a bit-packed clg buffer
+        rng (numpy Generator): the random number generator of the resampled
+            references
 
     Returns:
         float of the Computable Information Density for that microstate
 
     '''
-    n_p, random_reference = 0.0, 0.0
+    if compressor not in COMPRESSORS:
+        print("the compressor {} has not been registered".format(compressor))
+        return
     if model == 'clg':
-        n_p = lz_78_number_of_patterns(configuration)
-        random_reference = lz_78_number_of_patterns(''.join(str(x) for x in np.random.randint(2,size=len(configuration))))
-        cid = (n_p*np.log2(n_p))/(random_reference*np.log2(random_reference))
-        return cid
+        symbols = as_symbols(configuration)
     elif model == 'manna':
-        n_p = lz_78_number_of_patterns(configuration,'manna')
-        if random_shuffle:
-            random_reference = np.array(configuration)
-            np.random.shuffle(random_reference)
-            random_reference_str = ''.join(str(int(x)) for x in random_reference)
-            random_reference = lz_78_number_of_patterns(random_reference_str)
-            return (n_p * np.log2(n_p)) / (random_reference*np.log2(random_reference))
-        else:
-            return (n_p * np.log2(n_p)) / len(configuration)
+        symbols = as_symbols(flatten_manna_configuration(configuration))
     else:
         print("a compression scheme for {} has not been implemented".format(model))
         return
+
+    recorder = current_recorder()
+    key = None
+    if not resample_reference:
+        key = (configuration_key(symbols), len(symbols), model, random_shuffle,
+               reference_samples, compressor, packed)
+        if key in cid_cache:
+            cid_cache.move_to_end(key)
+            recorder.count('cid_cache_hits')
+            return cid_cache[key]
+
+    backend = COMPRESSORS[compressor]
+    with recorder.phase('compress'):
+        size = backend.size(symbols)
+    recorder.count('phrases' if backend.cost is entropy_operator else 'compressed_bytes', size)
+    cost = backend.cost(size)
+    with recorder.phase('reference'):
+        if model == 'clg':
+            reference = random_reference(len(symbols), 256 if packed else 2, None,
+                                         reference_samples, resample_reference, compressor, rng)
+        elif random_shuffle:
+            distribution = np.bincount(symbols)
+            reference = random_reference(len(symbols), len(distribution),
+                                         tuple(int(x) for x in distribution),
+                                         reference_samples, resample_reference, compressor, rng)
+        else:
+            reference = len(symbols)
+    value = cost/reference
+
+    if key is not None:
+        cid_cache[key] = value
+        if len(cid_cache) > CID_CACHE_SIZE:
+            cid_cache.popitem(last=False)
+    return value
@@ -0,0 +1,88 @@
+import numpy as np
+
+
+#==============================================================================
+# alphabet mapping the symbols 0-9 to their ascii digits, i.e. the encoding
+# of the string representation ''.join(str(int(x)) for x in lattice)
+#==============================================================================
+ASCII_DIGITS = np.arange(ord('0'), ord('9')+1, dtype=np.uint8)
+
+
+def encode_configuration(lattice, model='clg', max_symbol=9, alphabet=None, pack_bits=False):
+    ''' encodes a lattice as a compact buffer of symbols for the compressors
+
+    the occupation of every site is clipped to max_symbol (a clg site is
+    always 0 or 1) and stored as one uint8 symbol. The lattice itself is never
+    modified. An alphabet maps every symbol to another byte, e.g ASCII_DIGITS
+    reproduces the bytes of the string representation of the lattice. Binary
+    clg configurations may also be bit-packed, eight sites per byte, which is
+    meant for the byte oriented compressors and for storage: the lz78 pattern
+    count of a packed buffer is not the one of the configuration (see the
+    packed option of observables.compression.cid). A PackedCLGLattice is
+    returned as its packed bytes without being unpacked. The last axis is
+    encoded so an ensemble of lattices is encoded row by row
+
+    Args:
+        lattice (numpy array): the microstate of a system
+        model (string): the name of the model implemented on that system
+        max_symbol (int): the largest symbol of a manna site
+        alphabet (numpy array): the byte representing every symbol
+        pack_bits (bool): pack a binary configuration into bits
+
+    Returns:
+        numpy uint8 array of the encoded configuration
+    '''
+    if hasattr(lattice, 'packed_bytes'):
+        return lattice.packed_bytes()
+    if model == 'clg':
+        max_symbol = 1
+    symbols = np.clip(lattice, 0, max_symbol).astype(np.uint8)
+    if pack_bits:
+        if max_symbol > 1:
+            print("only binary configurations can be bit-packed")
+            return
+        return np.packbits(symbols, axis=-1, bitorder='little')
+    if alphabet is not None:
+        return np.asarray(alphabet, dtype=np.uint8)[symbols]
+    return symbols
+
+
+def as_symbols(configuration):
+    ''' returns a configuration as a uint8 numpy array without copying it
+
+    accepts the string representation of a lattice, bytes or any numpy array
+    and returns the symbol of every site. Strings of digits are mapped back to
+    the values of the digits, and so are bytes or uint8 buffers made only of
+    ascii digits (encoded with ASCII_DIGITS), which are copied to do so
+
+    Args:
+        configuration (str, bytes or numpy array): the microstate of a system
+
+    Returns:
+        numpy uint8 array of the symbols of the configuration
+    '''
+    if isinstance(configuration, str):
+        return np.frombuffer(configuration.encode(), dtype=np.uint8) - ord('0')
+    if isinstance(configuration, (bytes, bytearray, memoryview)):
+        return from_ascii_digits(np.frombuffer(configuration, dtype=np.uint8))
+    configuration = np.asarray(configuration)
+    if configuration.dtype == np.uint8:
+        return from_ascii_digits(configuration)
+    return configuration.astype(np.uint8, copy=False)
+
+
+def from_ascii_digits(symbols):
+    ''' maps a uint8 buffer of ascii digits back to the values of the digits,
+    any other buffer is returned as is '''
+    if len(symbols) and symbols.min() >= ASCII_DIGITS[0] and symbols.max() <= ASCII_DIGITS[-1]:
+        return symbols - ASCII_DIGITS[0]
+    return symbols
+
+
+def to_bytes(configuration):
+    ''' returns the bytes of an encoded configuration '''
+    if isinstance(configuration, (bytes, bytearray)):
+        return bytes(configuration)
+    if isinstance(configuration, str):
+        return configuration.encode()
+    return np.ascontiguousarray(configuration, dtype=np.uint8).tobytes()
@@ -0,0 +1,150 @@
+import numpy as np
+
+from models.clg import find_active_mask
+from observables.compression import cid
+from observables.block_cid import block_cid, shared_executor
+from observables.encoding import encode_configuration
+from utils.instrumentation import current_recorder
+
+
+class Snapshot(object):
+    ''' a lattice together with the intermediates shared by its observables
+
+    the encoded configuration, the active sites mask and the fourier transform
+    of the density fluctuations are computed the first time an observable
+    needs them and are then reused by all the other observables of the same
+    snapshot. The lattice may also be an (R,L) ensemble of lattices in which
+    case every observable is computed for every row
+
+    Args:
+        lattice (numpy array): the microstate of a system
+        model (string): the name of the model implemented on that system
+        z (int): threshold value for the activity of a manna site
+        compressor (string): the compression backend of the cid
+        rng (numpy Generator): the random number generator of the observables
+
+    '''
+    def __init__(self, lattice, model='clg', z=2, compressor='lz78', rng=None):
+        self.lattice = lattice
+        self.model = model
+        self.z = z
+        self.compressor = compressor
+        self.rng = rng
+        self.L = lattice.shape[-1]
+        self._encoded = None
+        self._active_mask = None
+        self._fourier = None
+
+    @property
+    def encoded(self):
+        if self._encoded is None:
+            with current_recorder().phase('encode'):
+                self._encoded = encode_configuration(self.lattice, self.model)
+        return self._encoded
+
+    @property
+    def active_mask(self):
+        if self._active_mask is None:
+            if self.model == 'clg':
+                self._active_mask = find_active_mask(self.lattice)
+            else:
+                self._active_mask = self.lattice > self.z
+        return self._active_mask
+
+    @property
+    def fourier(self):
+        if self._fourier is None:
+            fluctuations = self.lattice - self.lattice.mean(axis=-1, keepdims=True)
+            self._fourier = np.fft.rfft(fluctuations, axis=-1)
+        return self._fourier
+
+
+def measure_cid(snapshot):
+    if snapshot.encoded.ndim == 1:
+        return cid(snapshot.encoded, snapshot.model, compressor=snapshot.compressor, rng=snapshot.rng)
+    return np.array([cid(row, snapshot.model, compressor=snapshot.compressor, rng=snapshot.rng)
+                     for row in snapshot.encoded])
+
+
+def measure_block_cid(snapshot):
+    ''' the block estimate of the cid (see observables.block_cid), the blocks
+    are compressed by the thread pool of the process for the compressors which
+    release the GIL and serially otherwise, so it can be measured inside worker
+    processes '''
+    executor = shared_executor(snapshot.compressor)
+    if snapshot.encoded.ndim == 1:
+        return block_cid(snapshot.encoded, snapshot.model, compressor=snapshot.compressor, executor=executor)
+    return np.array([block_cid(row, snapshot.model, compressor=snapshot.compressor, executor=executor)
+                     for row in snapshot.encoded])
+
+
+def measure_activity(snapshot):
+    ''' the density of active sites of a clg lattice (as clg_activity) or of
+    particles on active sites of a manna lattice (as manna_activity) '''
+    if snapshot.model == 'clg':
+        return snapshot.active_mask.mean(axis=-1)
+    return np.where(snapshot.active_mask, snapshot.lattice, 0).sum(axis=-1)/snapshot.L
+
+
+def measure_density(snapshot):
+    return snapshot.lattice.sum(axis=-1)/snapshot.L
+
+
+def measure_structure_factor(snapshot):
+    ''' S(q) = |rho(q)|^2/L for the wave numbers q = 2*pi*k/L, k=0..L/2 '''
+    return np.abs(snapshot.fourier)**2/snapshot.L
+
+
+def measure_correlation(snapshot):
+    ''' the connected two point correlation <dn(x)dn(x+r)> for r=0..L/2,
+    computed as the inverse transform of the structure factor '''
+    correlation = np.fft.irfft(np.abs(snapshot.fourier)**2, n=snapshot.L, axis=-1)/snapshot.L
+    return correlation[..., :snapshot.L//2+1]
+
+
+#==============================================================================
+# the observables which can be measured on a snapshot, every one of them maps
+# a Snapshot to its value (a number, or an array for the correlation and the
+# structure factor which have L/2+1 values)
+#==============================================================================
+OBSERVABLES = {
+    'cid': measure_cid,
+    'block_cid': measure_block_cid,
+    'activity': measure_activity,
+    'density': measure_density,
+    'structure_factor': measure_structure_factor,
+    'correlation': measure_correlation,
+}
+
+VECTOR_OBSERVABLES = ('structure_factor', 'correlation')
+
+
+def observable_shape(observable, L):
+    ''' returns the shape of the value of an observable on a lattice of L sites '''
+    if observable in VECTOR_OBSERVABLES:
+        return (L//2+1,)
+    return ()
+
+
+def measure(lattice, observables, model='clg', z=2, compressor='lz78', rng=None):
+    ''' measures several observables of a lattice in a single pass
+
+    Args:
+        lattice (numpy array): the microstate of a system (or an ensemble)
+        observables (list): the names of the observables, see OBSERVABLES
+        model (string): the name of the model implemented on that system
+        z (int): threshold value for the activity of a manna site
+        compressor (string): the compression backend of the cid
+        rng (numpy Generator): the random number generator of the observables
+
+    Returns:
+        dictionary of the value of every observable
+    '''
+    snapshot = Snapshot(lattice, model, z, compressor, rng)
+    values = {}
+    for observable in observables:
+        if observable not in OBSERVABLES:
+            print("the observable {} has not been implemented".format(observable))
+            return
+        values[observable] = OBSERVABLES[observable](snapshot)
+    return values
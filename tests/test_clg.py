@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+
+from models.clg import create_clg_lattice, create_clg_ensemble, find_active_sites, find_active_mask, parallel_update, \
+    vectorized_parallel_update, batched_random_sequential_update
+from models.packed_clg import PackedCLGLattice
+
+
+def random_lattices(L, count, seed=0):
+    rng = np.random.default_rng(seed)
+    for sample in range(count):
+        yield create_clg_lattice(int(rng.integers(L + 1)), L, rng)
+
+
+def without_competition(lattice):
+    ''' True if no two active sites are two sites apart around the ring, so
+    that no two active particles compete over a site. This excludes the 11011
+    competitions as well as the 01110 pattern and the pairs across the
+    boundary which fix_competition resolves but vectorized_parallel_update
+    does not consider as competing. The active pairs across the boundary are
+    excluded as well, parallel_update moves the particle of site 0 before it
+    reads the neighbor of site L-1 '''
+    sites = find_active_sites(lattice)
+    L = len(lattice)
+    if 0 in sites and L - 1 in sites:
+        return False
+    return not any((site + 2) % L in sites for site in sites)
+
+
+def competition_free_lattices(L, count, seed=0):
+    ''' draws lattices made of runs of 1, 2, 4 or 5 particles separated by at
+    least two empty sites, which have many active sites but no competition '''
+    rng = np.random.default_rng(seed)
+    lattices = []
+    while len(lattices) < count:
+        runs = []
+        while sum(len(run) for run in runs) < L:
+            runs.append([0.0]*int(rng.integers(2, 6)))
+            runs.append([1.0]*int(rng.choice([1, 2, 4, 5])))
+        lattice = np.roll(np.concatenate(runs)[:L], rng.integers(L))
+        if without_competition(lattice) and find_active_mask(lattice).any():
+            lattices.append(lattice)
+    return lattices
+
+
+@pytest.mark.parametrize('L', [3, 10, 64, 101])
+def test_find_active_mask_matches_find_active_sites(L):
+    for lattice in random_lattices(L, 50):
+        assert np.flatnonzero(find_active_mask(lattice)).tolist() == find_active_sites(lattice)
+
+
+def test_find_active_mask_of_an_ensemble():
+    lattices = np.array(list(random_lattices(40, 8)))
+    mask = find_active_mask(lattices)
+    for lattice, row in zip(lattices, mask):
+        assert np.flatnonzero(row).tolist() == find_active_sites(lattice)
+
+
+@pytest.mark.parametrize('L', [10, 37, 100])
+def test_vectorized_parallel_update_matches_parallel_update(L):
+    for lattice in competition_free_lattices(L, 50, seed=L):
+        reference, vectorized = lattice.copy(), lattice.copy()
+        assert vectorized_parallel_update(vectorized) == parallel_update(reference)
+        np.testing.assert_array_equal(vectorized, reference)
+
+
+def test_the_boundary_is_read_before_the_update():
+    lattice = np.array([1.0, 0, 0, 0, 0, 1, 0, 0, 0, 1])
+    reference, vectorized = lattice.copy(), lattice.copy()
+    parallel_update(reference)
+    vectorized_parallel_update(vectorized)
+    np.testing.assert_array_equal(reference, [1.0, 1, 0, 0, 0, 1, 0, 0, 0, 0])
+    np.testing.assert_array_equal(vectorized, [0.0, 1, 0, 0, 0, 1, 0, 0, 1, 0])
+
+
+def test_absorbed_lattices_are_not_updated():
+    for lattice in (np.zeros(10), np.ones(10), np.tile([1.0, 0.0], 5)):
+        reference, vectorized = lattice.copy(), lattice.copy()
+        assert vectorized_parallel_update(vectorized) and parallel_update(reference)
+        np.testing.assert_array_equal(vectorized, reference)
+
+
+def test_vectorized_parallel_update_resolves_competitions():
+    rng = np.random.default_rng(1)
+    for lattice in random_lattices(50, 100):
+        n = lattice.sum()
+        vectorized_parallel_update(lattice, 5, rng=rng)
+        assert lattice.sum() == n
+        assert set(np.unique(lattice)) <= {0.0, 1.0}
+
+
+@pytest.mark.parametrize('L', [10, 64, 65, 130, 200])
+def test_packed_parallel_update_matches_vectorized_parallel_update(L):
+    for lattice in competition_free_lattices(L, 50, seed=L):
+        packed = PackedCLGLattice.from_lattice(lattice)
+        np.testing.assert_array_equal(packed.to_lattice(), lattice)
+        assert packed.parallel_update() == vectorized_parallel_update(lattice)
+        np.testing.assert_array_equal(packed.to_lattice(), lattice)
+
+
+@pytest.mark.parametrize('L', [10, 65, 130])
+def test_packed_activity_matches_find_active_mask(L):
+    for lattice in random_lattices(L, 50):
+        assert PackedCLGLattice.from_lattice(lattice).activity() == pytest.approx(find_active_mask(lattice).mean())
+
+
+@pytest.mark.parametrize('L', [3, 5, 50])
+def test_batched_random_sequential_update_keeps_its_index_consistent(L):
+    lattices = create_clg_ensemble(L//2 + 1, L, 20, np.random.default_rng(L))
+    shorter = lattices.copy()
+    activity = np.zeros((200, 20))
+    batched_random_sequential_update(lattices, 200, activity, np.random.default_rng(0))
+    batched_random_sequential_update(shorter, 199, None, np.random.default_rng(0))
+    np.testing.assert_array_equal(lattices.sum(axis=1), L//2 + 1)
+    assert set(np.unique(lattices)) <= {0.0, 1.0}
+    # the activity of the last timestep is read from the index updated by the hops
+    np.testing.assert_allclose(activity[199], find_active_mask(shorter).mean(axis=1))
+
+
+def test_batched_random_sequential_update_without_a_generator():
+    lattices = create_clg_ensemble(30, 50, 4)
+    activity = np.zeros((20, 4))
+    batched_random_sequential_update(lattices, 20, activity)
+    np.testing.assert_array_equal(lattices.sum(axis=1), 30)
+    assert set(np.unique(lattices)) <= {0.0, 1.0}
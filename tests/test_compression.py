@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from models.manna import create_manna_lattice
+from observables.compression import lz_78, lz_78_phrase_count, lz_78_number_of_patterns, cid
+from observables.encoding import encode_configuration, ASCII_DIGITS
+
+
+def random_strings(L, count, seed=0):
+    rng = np.random.default_rng(seed)
+    for sample in range(count):
+        yield ''.join(map(str, (rng.random(L) < rng.random()).astype(int)))
+
+
+@pytest.mark.parametrize('L', [0, 1, 2, 17, 200])
+def test_phrase_count_of_strings(L):
+    for configuration in random_strings(L, 20, seed=L):
+        assert lz_78_phrase_count(configuration) == len(lz_78(configuration))
+
+
+@pytest.mark.parametrize('configuration', ['0', '1111111111', '0101010101', '0001000100010001'])
+def test_phrase_count_of_periodic_strings(configuration):
+    assert lz_78_phrase_count(configuration) == len(lz_78(configuration))
+
+
+@pytest.mark.parametrize('L', [1, 17, 200])
+def test_phrase_count_of_bytes_and_arrays(L):
+    for configuration in random_strings(L, 20, seed=L):
+        symbols = np.array([int(x) for x in configuration], dtype=np.uint8)
+        expected = len(lz_78(configuration))
+        assert lz_78_phrase_count(symbols.tobytes()) == expected
+        assert lz_78_phrase_count(bytearray(symbols.tobytes())) == expected
+        assert lz_78_phrase_count(symbols) == expected
+        assert lz_78_phrase_count(symbols.astype(float)) == expected
+        assert len(lz_78(symbols.tobytes())) == expected
+
+
+@pytest.mark.parametrize('n', [5, 50, 300])
+def test_phrase_count_of_manna_configurations(n):
+    rng = np.random.default_rng(n)
+    for sample in range(20):
+        lattice = create_manna_lattice(n, 100, rng)
+        lattice[rng.integers(100)] += 12
+        assert lz_78_number_of_patterns(lattice, 'manna') == len(lz_78(lattice, 'manna'))
+
+
+@pytest.mark.parametrize('compressor', ['lz78', 'zlib'])
+def test_cid_of_encoded_manna_configurations(compressor):
+    rng = np.random.default_rng(0)
+    lattice = create_manna_lattice(300, 100, rng)
+    lattice[3] += 12
+    expected = cid(lattice, 'manna', compressor=compressor)
+    string = ''.join(str(int(x)) for x in np.minimum(lattice, 9))
+    for configuration in (encode_configuration(lattice, 'manna'),
+                          encode_configuration(lattice, 'manna', alphabet=ASCII_DIGITS),
+                          string, string.encode()):
+        assert cid(configuration, 'manna', compressor=compressor) == pytest.approx(expected)
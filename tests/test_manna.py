@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from models.manna import create_manna_lattice, create_manna_ensemble, vectorized_manna_update, gillespie_manna_update
+
+Z = 1
+
+options = [dict(), dict(binomial=False), dict(only_excess_are_active=True),
+           dict(only_excess_are_active=True, randomized_non_excess=True, binomial=False)]
+
+
+@pytest.mark.parametrize('kwargs', options)
+@pytest.mark.parametrize('n', [10, 100, 300])
+def test_vectorized_manna_update_conserves_particles(n, kwargs):
+    rng = np.random.default_rng(n)
+    lattice = create_manna_lattice(n, 100, rng)
+    for step in range(20):
+        vectorized_manna_update(lattice, 5, Z, rng=rng, **kwargs)
+        assert lattice.sum() == n
+        assert lattice.min() >= 0
+
+
+@pytest.mark.parametrize('kwargs', options)
+def test_vectorized_manna_update_conserves_the_particles_of_every_lattice(kwargs):
+    rng = np.random.default_rng(0)
+    lattices = create_manna_ensemble(80, 50, 6, rng)
+    vectorized_manna_update(lattices, 50, Z, rng=rng, **kwargs)
+    np.testing.assert_array_equal(lattices.sum(axis=1), 80)
+    assert lattices.min() >= 0
+
+
+@pytest.mark.parametrize('kwargs', options)
+@pytest.mark.parametrize('n', [10, 100, 300])
+def test_gillespie_manna_update_conserves_particles(n, kwargs):
+    rng = np.random.default_rng(n)
+    lattice = create_manna_lattice(n, 100, rng)
+    for step in range(20):
+        gillespie_manna_update(lattice, 0.5, Z, rng=rng, **kwargs)
+        assert lattice.sum() == n
+        assert lattice.min() >= 0
+
+
+def test_gillespie_manna_update_stops_at_absorption():
+    rng = np.random.default_rng(0)
+    lattice = create_manna_lattice(20, 100, rng)
+    assert gillespie_manna_update(lattice, 1e6, Z, rng=rng)
+    assert lattice.sum() == 20
+    assert lattice.max() <= Z
@@ -0,0 +1,13 @@
+import numpy as np
+import pytest
+
+from utils.pipeline import pipelined_realizations
+from utils.simulator import create_multiple_realizations
+
+
+@pytest.mark.parametrize('model', ['clg', 'manna'])
+def test_pipelined_realizations_match_the_pool(model):
+    L, N, T, R = 200, [80, 120], [50, 50, 50], 3
+    pool = create_multiple_realizations(L, N, T, R, model, 'cid', workers=2, seed=7)
+    pipelined = pipelined_realizations(L, N, T, R, model, 'cid', simulation_workers=1, measurement_workers=1, seed=7)
+    np.testing.assert_array_equal(pipelined, pool)
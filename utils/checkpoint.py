@@ -0,0 +1,110 @@
+import os
+import pickle
+import random
+import numpy as np
+
+
+#==============================================================================
+# a checkpoint holds everything needed to continue the propagation of a single
+# (realization, n) task: the lattice, the random number generators states, the
+# number of updates performed so far, the schedule T and the values measured
+# so far, and the order of the active sites index of the random sequential
+# clg update, whose hops depend on it. clg lattices are bit-packed and manna lattices are stored with the
+# smallest unsigned integer type which fits their largest site
+#==============================================================================
+
+def checkpoint_path(directory, realization, n):
+    return os.path.join(directory, 'checkpoint_r{}_n{}.npz'.format(realization, n))
+
+
+def pack_lattice(lattice, model='clg'):
+    if model == 'clg':
+        return np.packbits(lattice.astype(np.uint8))
+    return lattice.astype(np.min_scalar_type(int(lattice.max()) if len(lattice) else 0))
+
+
+def unpack_lattice(packed, L, model='clg'):
+    if model == 'clg':
+        return np.unpackbits(packed)[:L].astype(float)
+    return packed.astype(float)
+
+
+def save_checkpoint(path, lattice, steps, T, values, model='clg', rng=None, active_sites=None):
+    ''' saves the state of a (realization, n) task
+
+    the checkpoint is first written to a temporary file which then replaces
+    the previous checkpoint, so a job killed while writing never leaves a
+    corrupted checkpoint behind
+
+    Args:
+        path (string): the path of the checkpoint
+        lattice (numpy array): the lattice of the task
+        steps (int): the number of updates (or the time) propagated so far
+        T (list): the propagation times of the task
+        values (list): the values measured so far (numbers or dictionaries of
+            the values of several observables)
+        model (string): the name of the model
+        rng (numpy Generator): the generator of the task, whose state is saved
+            along with the global ones
+        active_sites (ActiveSiteIndex): the active sites index kept by the
+            task, whose order is saved
+
+    Returns:
+        None
+    '''
+    generator_state = rng.bit_generator.state if rng is not None else None
+    rng_state = pickle.dumps((np.random.get_state(), random.getstate(), generator_state))
+    temporary_path = path + '.tmp.npz'
+    index = {} if active_sites is None else {'active_sites': np.asarray(active_sites.sites, dtype=np.int64)}
+    np.savez(temporary_path, lattice=pack_lattice(lattice, model), L=len(lattice),
+             steps=steps, T=np.asarray(T),
+             values=np.frombuffer(pickle.dumps(values), dtype=np.uint8),
+             rng_state=np.frombuffer(rng_state, dtype=np.uint8), **index)
+    os.replace(temporary_path, path)
+
+
+def matches_checkpoint(path, T):
+    ''' True if there is no checkpoint at path or if it can be continued with
+    the propagation times T, prints the mismatch otherwise '''
+    if not os.path.exists(path):
+        return True
+    with np.load(path) as checkpoint:
+        saved_T = checkpoint['T'].tolist()
+    if list(T[:len(saved_T)]) != saved_T:
+        print("the checkpoint {} was saved for the times {} which do not "\
+              "start the times {}".format(path, saved_T, list(T)))
+        return False
+    return True
+
+
+def load_checkpoint(path, T, model='clg', rng=None):
+    ''' loads the state of a (realization, n) task and restores its generators
+
+    a checkpoint can be continued with the schedule it was saved with or with
+    any schedule which starts with it, in which case the task is extended by
+    the additional propagation times
+
+    Args:
+        path (string): the path of the checkpoint
+        T (list): the propagation times of the task
+        model (string): the name of the model
+        rng (numpy Generator): the generator of the task, its saved state is
+            restored into it
+
+    Returns:
+        the lattice, the number of updates performed, the list of the
+        measured values and the saved order of the active sites (None if no
+        index was saved), or None if the checkpoint does not match T
+    '''
+    if not matches_checkpoint(path, T):
+        return
+    with np.load(path) as checkpoint:
+        lattice = unpack_lattice(checkpoint['lattice'], int(checkpoint['L']), model)
+        states = pickle.loads(checkpoint['rng_state'].tobytes())
+        np.random.set_state(states[0])
+        random.setstate(states[1])
+        # checkpoints saved before the task generators only hold two states
+        if rng is not None and len(states) > 2 and states[2] is not None:
+            rng.bit_generator.state = states[2]
+        active_sites = checkpoint['active_sites'].tolist() if 'active_sites' in checkpoint.files else None
+        return lattice, checkpoint['steps'].item(), pickle.loads(checkpoint['values'].tobytes()), active_sites
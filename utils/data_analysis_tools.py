@@ -1,6 +1,7 @@
 import pandas as pd
 import os
-from main.simulator import create_index
+from utils.simulator import create_index
+from utils.results_store import open_results_store, load_store_metadata
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -26,8 +27,11 @@ def create_figure_caption(L,N,T,R, model = 'clg'):
     return ""
 
 def visualize_results(L, N, T, cores, model, data, y_caption_height=-0.4, analytical_result=False, activity=False):
-    average_values = data.applymap(lambda x : sum(x)/len(x))
-    standard_deviation = data.applymap(lambda x : np.std(x))
+    # data is either a RunningStatistics or a table of lists as analyze_data returns
+    if not isinstance(data, RunningStatistics):
+        data = aggregate_table(data, N, T)
+    average_values = data.mean_table()
+    standard_deviation = data.std_table()
 
     rect = 0.25,0.25,0.5,0.5
     clg_figure = plt.figure(figsize=[12,10],facecolor='white')
@@ -77,7 +81,7 @@ def create_data_table(N,T):
     data_table = pd.DataFrame(index=create_index(T),columns=N)
     for index in data_table.index:
         for column in data_table.columns:
-            data_table[column][index] = []
+            data_table.at[index,column] = []
     return data_table
 
 
@@ -86,9 +90,223 @@ def insert_data(R,data_table):
         realization_table = pd.read_csv(realization)
         for index_realization,index_data in enumerate(data_table.index):
             for column in data_table.columns:
-                data_table[column][index_data].append(realization_table[unicode(str(column),"utf-8")][index_realization])
+                data_table[column][index_data].append(realization_table[str(column)][index_realization])
     return data_table
 
+def ensemble_table(results,N,T):
+    ''' converts an ensemble array into the table returned by analyze_data
+
+    Args:
+        results (numpy array): array of shape (R,len(T)+1,len(N)) as returned
+            by create_ensemble
+        N (list): number of particles
+        T (list): propagation times
+
+    Returns:
+        pandas DataFrame with N as columns, create_index(T) as rows and the
+        list of the values of all the realizations in each cell
+    '''
+    data_table = create_data_table(N,T)
+    for t_loc,index in enumerate(data_table.index):
+        for n_loc,column in enumerate(data_table.columns):
+            data_table.at[index,column] = list(results[:,t_loc,n_loc])
+    return data_table
+
+def load_results(path):
+    ''' reads a results store into the table returned by analyze_data
+
+    Args:
+        path (string): the path of the .npy results store
+
+    Returns:
+        pandas DataFrame with N as columns, create_index(T) as rows and the
+        list of the values of all the realizations in each cell
+    '''
+    N, T = load_store_metadata(path)
+    return ensemble_table(open_results_store(path),N,T)
+
 def remove_realization_files(R):
     for realization in ['realization'+str(r)+'.csv' for r in range(R)]:
         os.remove(realization)
+
+##### Streaming Aggregation #####
+
+class QuantileSketch(object):
+    ''' a mergeable reservoir sample of every (time, n) cell
+
+    keeps up to capacity uniformly chosen values of every cell, from which
+    approximate quantiles are computed. Two sketches are merged by drawing
+    from the union of their reservoirs with probabilities proportional to the
+    number of values every reservoir stands for
+
+    Args:
+        shape (tuple): the shape of the cells, (len(T)+1,len(N))
+        capacity (int): the number of values kept for every cell
+        rng (numpy Generator): the generator of the reservoir draws
+
+    '''
+    def __init__(self, shape, capacity=64, rng=None):
+        self.capacity = capacity
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.seen = np.zeros(shape, dtype=np.int64)
+        self.samples = np.full(shape + (capacity,), np.nan)
+
+    def update(self, values, n_loc=None):
+        ''' adds one value to every cell (of the column n_loc if given) '''
+        cells = np.s_[:, n_loc] if n_loc is not None else np.s_[:, :]
+        seen = self.seen[cells]
+        samples = self.samples[cells]
+        values = np.broadcast_to(values, seen.shape)
+        for cell in zip(*np.nonzero(~np.isnan(values))):
+            if seen[cell] < self.capacity:
+                samples[cell + (seen[cell],)] = values[cell]
+            else:
+                slot = self.rng.integers(seen[cell] + 1)
+                if slot < self.capacity:
+                    samples[cell + (slot,)] = values[cell]
+            seen[cell] += 1
+
+    def merge(self, other):
+        ''' merges the reservoirs of another sketch into this one '''
+        for cell in zip(*np.nonzero(other.seen)):
+            kept = self.samples[cell][:min(self.seen[cell], self.capacity)]
+            other_kept = other.samples[cell][:min(other.seen[cell], other.capacity)]
+            pool = np.concatenate([kept, other_kept])
+            if len(pool) > self.capacity:
+                weights = np.concatenate([np.full(len(kept), float(self.seen[cell])/max(len(kept), 1)),
+                                          np.full(len(other_kept), float(other.seen[cell])/len(other_kept))])
+                pool = self.rng.choice(pool, self.capacity, replace=False, p=weights/weights.sum())
+            self.samples[cell] = np.nan
+            self.samples[cell][:len(pool)] = pool
+            self.seen[cell] += other.seen[cell]
+
+    def quantile(self, q):
+        ''' returns the approximate q quantile of every cell '''
+        return np.nanquantile(self.samples, q, axis=-1)
+
+
+class RunningStatistics(object):
+    ''' streaming count, mean and variance of every (time, n) cell of a sweep
+
+    values are folded in as soon as they are available, using Welford's update
+    for single values and Chan's parallel formula for blocks of realizations
+    and for merging the partial statistics of different workers or files, so
+    the values of the realizations themselves are never kept
+
+    Args:
+        N (list): number of particles
+        T (list): propagation times
+        quantile_capacity (int): size of the reservoir of a QuantileSketch
+            kept for every cell, no sketch is kept if 0
+        seed (int): seed of the reservoir draws of the sketch
+
+    '''
+    def __init__(self, N, T, quantile_capacity=0, seed=None):
+        self.N = list(N)
+        self.T = list(T)
+        shape = (len(T)+1, len(N))
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.sketch = QuantileSketch(shape, quantile_capacity, np.random.default_rng(seed)) if quantile_capacity else None
+
+    def update(self, values, n_loc=None):
+        ''' adds the values of one realization
+
+        Args:
+            values (numpy array): the values of a realization at every time of
+                create_index(T), for the column n_loc if given or for all the
+                columns otherwise. nan values are ignored
+        '''
+        cells = np.s_[:, n_loc] if n_loc is not None else np.s_[:, :]
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        count = self.count[cells] + valid
+        delta = np.where(valid, values - self.mean[cells], 0.0)
+        mean = self.mean[cells] + np.where(valid, delta/np.maximum(count, 1), 0.0)
+        self.m2[cells] += np.where(valid, delta*(values - mean), 0.0)
+        self.mean[cells] = mean
+        self.count[cells] = count
+        if self.sketch is not None:
+            self.sketch.update(values, n_loc)
+
+    def update_batch(self, results):
+        ''' adds a block of realizations of shape (R,len(T)+1,len(N)) '''
+        results = np.asarray(results, dtype=float)
+        block = RunningStatistics(self.N, self.T)
+        valid = ~np.isnan(results)
+        block.count = valid.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            block.mean = np.where(block.count > 0, np.nansum(results, axis=0)/block.count, 0.0)
+        block.m2 = np.nansum((results - block.mean)**2, axis=0)
+        self.merge(block)
+        if self.sketch is not None:
+            for realization in results:
+                self.sketch.update(realization)
+
+    def merge(self, other):
+        ''' merges the statistics of another RunningStatistics of the sweep '''
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        safe_count = np.maximum(count, 1)
+        self.mean = self.mean + delta*other.count/safe_count
+        self.m2 = self.m2 + other.m2 + delta**2*self.count*other.count/safe_count
+        self.count = count
+        if self.sketch is not None and other.sketch is not None:
+            self.sketch.merge(other.sketch)
+
+    def variance(self):
+        ''' returns the population variance of every cell (as np.var) '''
+        return self.m2/np.maximum(self.count, 1)
+
+    def std(self):
+        return np.sqrt(self.variance())
+
+    def table(self, values):
+        ''' returns values of every cell as a DataFrame like analyze_data '''
+        return pd.DataFrame(values, index=create_index(self.T), columns=self.N)
+
+    def mean_table(self):
+        return self.table(np.where(self.count > 0, self.mean, np.nan))
+
+    def std_table(self):
+        return self.table(np.where(self.count > 0, self.std(), np.nan))
+
+    def quantile_table(self, q):
+        return self.table(self.sketch.quantile(q))
+
+
+def aggregate_table(data, N, T, quantile_capacity=0, seed=None):
+    ''' computes the RunningStatistics of a table returned by analyze_data '''
+    statistics = RunningStatistics(N, T, quantile_capacity, seed)
+    for t_loc in range(len(data.index)):
+        for n_loc in range(len(data.columns)):
+            for value in data.iat[t_loc, n_loc]:
+                values = np.full(len(T)+1, np.nan)
+                values[t_loc] = value
+                statistics.update(values, n_loc)
+    return statistics
+
+
+def aggregate_store(path, chunk=256, quantile_capacity=0, seed=None):
+    ''' computes the RunningStatistics of a results store
+
+    the store is read in chunks of realizations so that it is never loaded
+    into memory as a whole. Tasks which have not been written yet (nan) are
+    ignored
+
+    Args:
+        path (string): the path of the .npy results store
+        chunk (int): the number of realizations read at once
+        quantile_capacity (int): size of the quantile reservoirs
+        seed (int): seed of the reservoir draws
+
+    Returns:
+        RunningStatistics of the store
+    '''
+    N, T = load_store_metadata(path)
+    store = open_results_store(path)
+    statistics = RunningStatistics(N, T, quantile_capacity, seed)
+    for start in range(0, store.shape[0], chunk):
+        statistics.update_batch(store[start:start+chunk])
+    return statistics
@@ -0,0 +1,189 @@
+import cProfile
+import glob
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+import pandas as pd
+
+
+#==============================================================================
+# instrumentation of the hot paths of a sweep. a Recorder accumulates the time
+# spent in every phase of a (realization, n) task (initialize, update, measure
+# and within it encode, compress and reference, checkpoint, write) and counters
+# of the work done (steps, active sites, lz phrases or compressed bytes, cid
+# cache hits). emit(t) closes the interval ending at the time t of
+# create_index(T) as one structured record, a dictionary which is appended as
+# a json line to the file of the task so the records of all the workers are
+# aggregated afterwards by load_records and aggregate_records.
+# the code being instrumented reports to the recorder of the running task
+# (current_recorder). without one it gets the NULL_RECORDER whose methods do
+# nothing, so a sweep which is not instrumented only pays for a few calls of
+# empty methods per measurement and nothing per lattice update
+#==============================================================================
+
+def records_path(directory, realization, n):
+    return os.path.join(directory, 'records_r{}_n{}.jsonl'.format(realization, n))
+
+
+def profile_path(directory, realization, n):
+    return os.path.join(directory, 'profile_r{}_n{}.prof'.format(realization, n))
+
+
+class PhaseTimer(object):
+    ''' context manager adding the time spent in its block to a phase '''
+    def __init__(self, seconds, name):
+        self.seconds = seconds
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exception):
+        self.seconds[self.name] += time.perf_counter() - self.start
+
+
+class Recorder(object):
+    ''' per phase timers and counters of a (realization, n) task
+
+    phases may be nested, the time of a phase includes the phases within it
+    (the measure phase includes encode, compress and reference)
+
+    Args:
+        realization (int): the index of the realization of the task
+        n (int): the number of particles of the task
+        path (string): json lines file the records are appended to, the
+            records are only kept in records if None
+
+    '''
+    enabled = True
+
+    def __init__(self, realization=None, n=None, path=None):
+        self.realization = realization
+        self.n = n
+        self.path = path
+        self.records = []
+        self.seconds = defaultdict(float)
+        self.counters = defaultdict(int)
+
+    def phase(self, name):
+        return PhaseTimer(self.seconds, name)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def emit(self, t):
+        ''' closes the interval ending at time t as a record and resets the
+        timers and counters '''
+        record = {'realization': self.realization, 'n': self.n, 't': t,
+                  'seconds': dict(self.seconds), 'counters': dict(self.counters)}
+        self.records.append(record)
+        if self.path is not None:
+            with open(self.path, 'a') as records:
+                records.write(json.dumps(record) + '\n')
+        self.seconds.clear()
+        self.counters.clear()
+        return record
+
+
+class NullRecorder(object):
+    ''' the recorder of the tasks which are not instrumented '''
+    enabled = False
+    _phase = nullcontext()
+
+    def phase(self, name):
+        return self._phase
+
+    def count(self, name, value=1):
+        pass
+
+    def emit(self, t):
+        pass
+
+
+NULL_RECORDER = NullRecorder()
+
+_current = NULL_RECORDER
+
+
+def current_recorder():
+    ''' returns the recorder of the task running in this process '''
+    return _current
+
+
+class recording(object):
+    ''' makes recorder the current recorder within its block (the
+    NULL_RECORDER if recorder is None) '''
+    def __init__(self, recorder):
+        self.recorder = NULL_RECORDER if recorder is None else recorder
+
+    def __enter__(self):
+        global _current
+        self.previous = _current
+        _current = self.recorder
+        return self.recorder
+
+    def __exit__(self, *exception):
+        global _current
+        _current = self.previous
+
+
+def profile_call(path, function, *args):
+    ''' calls function(*args) under cProfile and dumps the statistics to path,
+    to be read with pstats.Stats(path) or snakeviz '''
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        profiler.dump_stats(path)
+
+
+def load_records(directory):
+    ''' reads the records of every task written to a directory '''
+    records = []
+    for path in sorted(glob.glob(os.path.join(directory, 'records_r*_n*.jsonl'))):
+        with open(path) as lines:
+            records.extend(json.loads(line) for line in lines if line.strip())
+    return records
+
+
+def aggregate_records(records, by=('n',)):
+    ''' sums the timers and counters of records
+
+    Args:
+        records (list): records as emitted by Recorder.emit
+        by (tuple): the record keys to group by ('realization', 'n', 't'),
+            all the records are summed together if empty
+
+    Returns:
+        pandas DataFrame with a seconds_<phase> column for every phase and a
+        column for every counter
+    '''
+    rows = []
+    for record in records:
+        row = {key: record[key] for key in by}
+        row.update({'seconds_' + name: value for name, value in record['seconds'].items()})
+        row.update(record['counters'])
+        rows.append(row)
+    table = pd.DataFrame(rows)
+    if table.empty:
+        return table
+    if by:
+        return table.groupby(list(by)).sum(min_count=1)
+    return table.sum(min_count=1).to_frame().T
+
+
+def summarize_records(records):
+    ''' prints the total time of every phase and the totals of the counters '''
+    totals = aggregate_records(records, ())
+    if totals.empty:
+        print("no instrumentation records were found")
+        return
+    totals = totals.iloc[0]
+    phases = totals[[column for column in totals.index if column.startswith('seconds_')]]
+    for name, seconds in phases.sort_values(ascending=False).items():
+        print("{:<20} {:>12.4f} s".format(name[len('seconds_'):], seconds))
+    for name, value in totals.drop(phases.index).items():
+        print("{:<20} {:>12.0f}".format(name, value))
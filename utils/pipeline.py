@@ -0,0 +1,170 @@
+import multiprocessing
+import os
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from models.clg import create_clg_lattice, create_active_site_index
+from models.manna import create_manna_lattice
+from utils.random_generators import root_sequence, task_generator
+from utils.simulator import propagate, measure, create_index, allocate_results, insert_values
+
+
+#==============================================================================
+# overlapped simulation and measurement of a sweep. simulation processes
+# propagate the (realization, n) tasks and, at every time of create_index(T),
+# copy the lattice into a free slot of a shared memory block and go on
+# propagating. measurement processes take the filled slots, compute the
+# observables of the snapshot in place (without pickling the lattice), return
+# the slot and send the values to the main process. the slots are handed out
+# through a queue of free slots, so a simulation process waits for a slot when
+# the measurements fall behind and the memory of the snapshots is bounded by
+# slots*L sites. snapshots of an absorbed lattice are not sent at all, the
+# last value of the task is repeated instead. the tasks are seeded as in
+# utils.simulator.create_multiple_realizations so both give the same values
+#==============================================================================
+
+def snapshot_dtype(model='clg'):
+    ''' the type of the sites of a snapshot, a manna site may hold many particles '''
+    return np.uint8 if model == 'clg' else np.uint16
+
+
+def slot_view(block, slot, L, model='clg'):
+    ''' returns the lattice stored in a slot of the shared memory block '''
+    dtype = snapshot_dtype(model)
+    return np.ndarray((L,), dtype=dtype, buffer=block.buf, offset=slot*L*np.dtype(dtype).itemsize)
+
+
+def simulation_worker(tasks, free_slots, snapshots, results, block, L, N, T, model, dynamics, entropy):
+    ''' propagates the tasks and hands their snapshots to the measurement workers '''
+    times = create_index(T)
+    for r, n_loc in iter(tasks.get, None):
+        rng = task_generator(entropy, r, n_loc)
+        if (model == 'clg'):
+            lattice = create_clg_lattice(N[n_loc], L, rng)
+        elif (model == 'manna'):
+            lattice = create_manna_lattice(N[n_loc], L, rng)
+        # one active sites index for the whole task, as in simulate_density
+        active_sites = create_active_site_index(lattice) if model == 'clg' and dynamics == 'discrete' else None
+        absorbed = False
+        for t_loc in range(len(times)):
+            if absorbed:
+                results.put((r, n_loc, t_loc, None))
+                continue
+            if t_loc > 0:
+                absorbed = propagate(lattice, times[t_loc] - times[t_loc-1], model, dynamics, rng, None, active_sites)
+            slot = free_slots.get()
+            slot_view(block, slot, L, model)[:] = lattice
+            snapshots.put((slot, r, n_loc, t_loc))
+
+
+def measurement_worker(free_slots, snapshots, results, block, L, model, observable, compressor):
+    ''' measures the snapshots of the slots and frees the slots '''
+    for slot, r, n_loc, t_loc in iter(snapshots.get, None):
+        lattice = slot_view(block, slot, L, model).astype(float)
+        free_slots.put(slot)
+        results.put((r, n_loc, t_loc, measure(lattice, model, observable, compressor)))
+
+
+def pipelined_realizations(L, N, T, R, model='clg', observable='cid', compressor='lz78', simulation_workers=None,
+                           measurement_workers=None, slots=None, dynamics='discrete', seed=None):
+    ''' computes the realizations of a sweep with overlapped updates and measurements
+
+    Args:
+        L (int): length of the lattice
+        N (list): number of particles
+        T (list): propagation times
+        R (int): number of realizations
+        model (string): the name of the model
+        observable (string): the name of an observable or a list of names
+            (see observables.measurements.OBSERVABLES)
+        compressor (string): the compression backend of the cid
+        simulation_workers (int): number of simulation processes, half of the
+            cores by default
+        measurement_workers (int): number of measurement processes, the other
+            half of the cores by default
+        slots (int): number of snapshots held in shared memory at once, twice
+            the number of measurement workers by default
+        dynamics (string): the update rule (see utils.simulator.propagate)
+        seed (int): seed of the generators of the tasks
+
+    Returns:
+        array of shape (R,len(T)+1,len(N)) of the observable of every
+        realization (or a dictionary of such arrays for a list of observables)
+        as create_multiple_realizations
+    '''
+    if (max(N) > L) and (model == 'clg'):
+        print("Cannot initailize a density of particles larger than 1")
+        return
+    cores = os.cpu_count() or 2
+    simulation_workers = simulation_workers or max(1, cores//2)
+    measurement_workers = measurement_workers or max(1, cores - simulation_workers)
+    slots = slots or 2*measurement_workers
+    entropy = root_sequence(seed).entropy
+    print("seeding the realizations with the entropy {}".format(entropy))
+
+    results = allocate_results(R, L, N, T, observable)
+    absorbed = np.zeros((R, len(T)+1, len(N)), dtype=bool)
+    tasks = sorted(((r, n_loc) for r in range(R) for n_loc in range(len(N))),
+                   key=lambda task: N[task[1]], reverse=True)
+    remaining = {task: len(T)+1 for task in tasks}
+
+    block = shared_memory.SharedMemory(create=True, size=max(1, slots*L*np.dtype(snapshot_dtype(model)).itemsize))
+    task_queue, free_slots = multiprocessing.Queue(), multiprocessing.Queue()
+    snapshots, values = multiprocessing.Queue(), multiprocessing.Queue()
+    for task in tasks:
+        task_queue.put(task)
+    for slot in range(slots):
+        free_slots.put(slot)
+    simulators = [multiprocessing.Process(target=simulation_worker,
+                                          args=(task_queue, free_slots, snapshots, values, block,
+                                                L, N, T, model, dynamics, entropy))
+                  for worker in range(simulation_workers)]
+    measurers = [multiprocessing.Process(target=measurement_worker,
+                                         args=(free_slots, snapshots, values, block, L, model, observable, compressor))
+                 for worker in range(measurement_workers)]
+    for worker in simulators:
+        task_queue.put(None)
+    try:
+        for worker in simulators + measurers:
+            worker.start()
+        received = 0
+        while received < len(tasks)*(len(T)+1):
+            try:
+                r, n_loc, t_loc, value = values.get(timeout=1)
+            except queue.Empty:
+                if any(worker.exitcode not in (None, 0) for worker in simulators + measurers):
+                    print("a worker of the pipeline has failed")
+                    return
+                continue
+            received += 1
+            if value is None:
+                absorbed[r, t_loc, n_loc] = True
+            else:
+                insert_values(results, np.s_[r, t_loc, n_loc], value)
+            remaining[(r, n_loc)] -= 1
+            if remaining[(r, n_loc)] == 0:
+                print("finished calculating density {} for realization {}".format(float(N[n_loc])/L, r))
+        for worker in measurers:
+            snapshots.put(None)
+        for worker in simulators + measurers:
+            worker.join()
+    finally:
+        for worker in simulators + measurers:
+            if worker.is_alive():
+                worker.terminate()
+        block.close()
+        block.unlink()
+
+    # the values of an absorbed lattice are the last value measured
+    for t_loc in range(1, len(T)+1):
+        r, n_loc = np.nonzero(absorbed[:, t_loc, :])
+        insert_values(results, np.s_[r, t_loc, n_loc], take_values(results, np.s_[r, t_loc-1, n_loc]))
+    return results
+
+
+def take_values(results, index):
+    if isinstance(results, dict):
+        return {name: results[name][index] for name in results}
+    return results[index]
@@ -0,0 +1,295 @@
+import argparse
+import heapq
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from models.clg import create_clg_lattice
+from models.manna import create_manna_lattice
+from observables.compression import cid_cache
+from utils.random_generators import root_sequence
+from utils.results_store import create_results_store, open_results_store, load_store_metadata
+from utils.simulator import create_multiple_realizations, propagate, measure
+
+
+#==============================================================================
+# planning of a sweep over the (realization, n) grid. calibrate times the
+# updates and the measurements of the model on small lattices at a few
+# densities and fits their cost as a linear function of L for every density.
+# plan_sweep extrapolates the cost of every task of the requested grid from
+# it, splits the tasks into shards of equal predicted runtime (longest
+# processing time first) and returns a json serializable plan holding the
+# sweep, the resolved seed and the tasks of every shard. every shard is run by
+# run_shard on any machine into its own results store, the tasks are seeded
+# by their (realization, n_loc) pair so the values do not depend on the
+# sharding, and merge_shards combines the stores of the shards into the store
+# of the whole sweep (see utils.results_store). report prints the predicted
+# runtime and peak memory of the plan without running anything
+#==============================================================================
+
+# steps of a calibration run, hops of the clg random sequential update or
+# parallel updates of the manna lattice
+CALIBRATION_STEPS = {'clg': 5000, 'manna': 50}
+
+CALIBRATION_SIZES = (1000, 4000)
+
+
+def time_task(L, n, steps, model='clg', observable='cid', compressor='lz78', dynamics='discrete', rng=None):
+    ''' returns the seconds per update, per measurement and the peak memory of
+    a short task on a lattice of L sites with n particles '''
+    if (model == 'clg'):
+        lattice = create_clg_lattice(n, L, rng)
+    elif (model == 'manna'):
+        lattice = create_manna_lattice(n, L, rng)
+    # the random reference is computed once per sweep, it is not part of a measurement
+    measure(lattice, model, observable, compressor)
+    start = time.perf_counter()
+    propagate(lattice, steps, model, dynamics, rng)
+    update_time = time.perf_counter() - start
+    cid_cache.clear()
+    start = time.perf_counter()
+    measure(lattice, model, observable, compressor)
+    measure_time = time.perf_counter() - start
+    # the memory is traced in a separate measurement which tracing slows down
+    cid_cache.clear()
+    tracemalloc.start()
+    measure(lattice, model, observable, compressor)
+    peak_memory = lattice.nbytes + tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return update_time/steps, measure_time, peak_memory
+
+
+def calibrate(model='clg', densities=(0.1, 0.3, 0.5, 0.7, 0.9), observable='cid', compressor='lz78',
+              dynamics='discrete', sizes=CALIBRATION_SIZES, steps=None, seed=0):
+    ''' fits the cost of the updates and the measurements of a model
+
+    Args:
+        model (string): the name of the model
+        densities (list): the densities the costs are measured at
+        observable (string): the observable of the sweep
+        compressor (string): the compression backend of the cid
+        dynamics (string): the update rule (see utils.simulator.propagate)
+        sizes (tuple): the two lattice sizes of the linear fit in L
+        steps (int): the number of steps of a calibration run
+        seed (int): seed of the calibration lattices
+
+    Returns:
+        dictionary of the intercepts and slopes in L of the seconds per step,
+        the seconds per measurement and the peak memory in bytes of a task at
+        every density
+    '''
+    steps = steps or CALIBRATION_STEPS[model]
+    rng = np.random.default_rng(seed)
+    calibration = {'model': model, 'observable': observable, 'compressor': compressor, 'dynamics': dynamics,
+                   'densities': [float(density) for density in densities],
+                   'process_memory': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024}
+    costs = {'step': [], 'measure': [], 'memory': []}
+    for density in densities:
+        measured = np.array([time_task(L, int(L*density), steps, model, observable, compressor, dynamics, rng)
+                             for L in sizes])
+        slopes = (measured[1] - measured[0])/(sizes[1] - sizes[0])
+        intercepts = measured[0] - slopes*sizes[0]
+        for name, intercept, slope in zip(costs, intercepts, slopes):
+            costs[name].append((float(intercept), float(slope)))
+    for name in costs:
+        calibration[name + '_intercept'], calibration[name + '_slope'] = map(list, zip(*costs[name]))
+    return calibration
+
+
+def predict_cost(calibration, name, L, density):
+    ''' the fitted cost ('step', 'measure' or 'memory') of a task, interpolated
+    between the calibrated densities and never negative '''
+    intercept = np.interp(density, calibration['densities'], calibration[name + '_intercept'])
+    slope = np.interp(density, calibration['densities'], calibration[name + '_slope'])
+    return max(0.0, float(intercept + slope*L))
+
+
+def predict_task(calibration, L, n, T):
+    ''' the predicted seconds of a task propagated for the times T '''
+    density = float(n)/L
+    return (sum(T)*predict_cost(calibration, 'step', L, density)
+            + (len(T)+1)*predict_cost(calibration, 'measure', L, density))
+
+
+def longest_processing_time(costs, bins):
+    ''' assigns the items of costs to bins, every item in turn from the most
+    costly one to the bin of the least load
+
+    Returns:
+        list of the item indices of every bin and list of the loads of the bins
+    '''
+    loads = [(0.0, b) for b in range(bins)]
+    assignment = [[] for b in range(bins)]
+    for item in sorted(range(len(costs)), key=lambda item: costs[item], reverse=True):
+        load, b = heapq.heappop(loads)
+        assignment[b].append(item)
+        heapq.heappush(loads, (load + costs[item], b))
+    total = [0.0]*bins
+    for load, b in loads:
+        total[b] = load
+    return assignment, total
+
+
+def plan_sweep(L, N, T, R, shards=1, workers=1, model='clg', observable='cid', compressor='lz78',
+               dynamics='discrete', seed=None, calibration=None):
+    ''' splits a sweep into shards of equal predicted runtime
+
+    Args:
+        L (int): length of the lattice
+        N (list): number of particles
+        T (list): propagation times
+        R (int): number of realizations
+        shards (int): the number of shards, e.g of machines
+        workers (int): the number of worker processes of every shard
+        model (string): the name of the model
+        observable (string): the name of the observable
+        compressor (string): the compression backend of the cid
+        dynamics (string): the update rule (see utils.simulator.propagate)
+        seed (int): seed of the sweep, fresh entropy if None
+        calibration (dict): as returned by calibrate, calibrated at the
+            densities of N (at most 8 of them) if None
+
+    Returns:
+        dictionary of the plan
+    '''
+    if calibration is None:
+        densities = np.unique(np.asarray(N, dtype=float)/L)
+        if len(densities) > 8:
+            densities = np.linspace(densities[0], densities[-1], 8)
+        calibration = calibrate(model, densities, observable, compressor, dynamics)
+    tasks = [(r, n_loc) for r in range(R) for n_loc in range(len(N))]
+    costs = [predict_task(calibration, L, N[n_loc], T) for r, n_loc in tasks]
+    memory = max(predict_cost(calibration, 'memory', L, float(n)/L) for n in N)
+    assignment, loads = longest_processing_time(costs, shards)
+
+    plan = {'L': L, 'N': [int(n) for n in N], 'T': list(T), 'R': R, 'model': model, 'observable': observable,
+            'compressor': compressor, 'dynamics': dynamics, 'seed': root_sequence(seed).entropy,
+            'workers': workers, 'calibration': calibration, 'shards': []}
+    for shard, items in enumerate(assignment):
+        # the tasks of a shard are listed from the longest one, as their workers take them
+        worker_items, worker_loads = longest_processing_time([costs[item] for item in items], workers)
+        plan['shards'].append({'shard': shard, 'tasks': [list(tasks[item]) for item in items],
+                               'predicted_cpu_seconds': loads[shard],
+                               'predicted_seconds': max(worker_loads)})
+    plan['predicted_cpu_seconds'] = sum(costs)
+    plan['predicted_seconds'] = max(shard['predicted_seconds'] for shard in plan['shards'])
+    # every worker holds one task, the main process of a shard its results store
+    plan['predicted_peak_memory'] = (workers*(memory + calibration['process_memory'])
+                                     + R*(len(T)+1)*len(N)*8)
+    return plan
+
+
+def save_plan(plan, path):
+    with open(path, 'w') as output:
+        json.dump(plan, output, indent=2)
+
+
+def load_plan(path):
+    with open(path) as plan:
+        return json.load(plan)
+
+
+def shard_path(directory, shard):
+    return os.path.join(directory, 'shard{}.npy'.format(shard))
+
+
+def run_shard(plan, shard, directory='.'):
+    ''' runs the tasks of a shard of a plan into the results store of the shard
+
+    Args:
+        plan (dict): as returned by plan_sweep
+        shard (int): the index of the shard
+        directory (string): the directory of the results stores of the shards
+
+    Returns:
+        numpy memmap of the results store of the shard, holding the values of
+        its tasks and nan for the tasks of the other shards
+    '''
+    tasks = plan['shards'][shard]['tasks']
+    path = shard_path(directory, shard)
+    start = time.perf_counter()
+    create_multiple_realizations(plan['L'], plan['N'], plan['T'], plan['R'], plan['model'], plan['observable'],
+                                 plan['compressor'], plan['workers'], path, dynamics=plan['dynamics'],
+                                 seed=plan['seed'], tasks=tasks)
+    print("shard {} took {:.1f} s, {:.1f} s were predicted".format(
+        shard, time.perf_counter() - start, plan['shards'][shard]['predicted_seconds']))
+    return open_results_store(path)
+
+
+def merge_shards(paths, path):
+    ''' merges the results stores of the shards of a sweep into one store
+
+    Args:
+        paths (list): the paths of the results stores of the shards
+        path (string): the path of the merged results store
+
+    Returns:
+        numpy memmap of the merged results store
+    '''
+    N, T = load_store_metadata(paths[0])
+    merged = None
+    for shard in paths:
+        values = open_results_store(shard)
+        if merged is None:
+            merged = create_results_store(path, values.shape[0], N, T)
+        written = ~np.isnan(values)
+        merged[written] = values[written]
+    merged.flush()
+    return merged
+
+
+def report(plan):
+    ''' prints the predicted runtime and peak memory of a plan (a dry run) '''
+    print("{} model, L={}, {} densities, {} realizations, {} updates".format(
+        plan['model'], plan['L'], len(plan['N']), plan['R'], sum(plan['T'])))
+    print("total predicted cpu time {:.1f} s".format(plan['predicted_cpu_seconds']))
+    for shard in plan['shards']:
+        print("shard {:<4} {:>6} tasks {:>12.1f} s".format(shard['shard'], len(shard['tasks']),
+                                                           shard['predicted_seconds']))
+    print("predicted runtime {:.1f} s with {} workers per shard".format(plan['predicted_seconds'], plan['workers']))
+    print("predicted peak memory per shard {:.1f} MB".format(plan['predicted_peak_memory']/2.0**20))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='plans, runs and merges the shards of a sweep')
+    commands = parser.add_subparsers(dest='command', required=True)
+    plan_parser = commands.add_parser('plan', help='calibrate, write a plan and report it')
+    plan_parser.add_argument('--L', type=int, required=True)
+    plan_parser.add_argument('--N', type=int, nargs='+', required=True)
+    plan_parser.add_argument('--T', type=int, nargs='+', required=True)
+    plan_parser.add_argument('--R', type=int, required=True)
+    plan_parser.add_argument('--shards', type=int, default=1)
+    plan_parser.add_argument('--workers', type=int, default=1)
+    plan_parser.add_argument('--model', default='clg')
+    plan_parser.add_argument('--compressor', default='lz78')
+    plan_parser.add_argument('--dynamics', default='discrete')
+    plan_parser.add_argument('--seed', type=int)
+    plan_parser.add_argument('--output', default='plan.json')
+    run_parser = commands.add_parser('run', help='run a shard of a plan')
+    run_parser.add_argument('plan')
+    run_parser.add_argument('shard', type=int)
+    run_parser.add_argument('--directory', default='.')
+    merge_parser = commands.add_parser('merge', help='merge the results stores of the shards')
+    merge_parser.add_argument('output')
+    merge_parser.add_argument('shards', nargs='+')
+    arguments = parser.parse_args(arguments)
+
+    if arguments.command == 'plan':
+        plan = plan_sweep(arguments.L, arguments.N, arguments.T, arguments.R, arguments.shards, arguments.workers,
+                          arguments.model, 'cid', arguments.compressor, arguments.dynamics, arguments.seed)
+        save_plan(plan, arguments.output)
+        report(plan)
+    elif arguments.command == 'run':
+        run_shard(load_plan(arguments.plan), arguments.shard, arguments.directory)
+    else:
+        merge_shards(arguments.shards, arguments.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import hashlib
+
+import numpy as np
+
+
+#==============================================================================
+# every sweep is seeded by a single root SeedSequence. the generator of the
+# (realization, n) task is spawned from it with the spawn key (realization,
+# n_loc), i.e it is the n_loc-th child of the realization-th child of the
+# root, so the streams of different tasks are independent, the same task gets
+# the same stream whichever worker runs it and in whatever order, and a sweep
+# is reproduced by passing the entropy of its root as the seed
+#==============================================================================
+
+def root_sequence(seed=None):
+    ''' returns the root SeedSequence of a sweep, fresh entropy if seed is None '''
+    return np.random.SeedSequence(seed)
+
+
+def task_generator(entropy, realization, n_loc):
+    ''' returns the numpy Generator of the (realization, n) task of a sweep
+
+    Args:
+        entropy (int): the entropy of the root SeedSequence of the sweep
+        realization (int): the index of the realization
+        n_loc (int): the index of the number of particles in N
+
+    Returns:
+        numpy Generator
+    '''
+    return np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(realization, n_loc)))
+
+
+def realization_key(signature):
+    ''' returns the realization index of the spawn key of a signature
+
+    a numeric signature is its own index, so create_realization(signature=r)
+    reproduces the realization r of create_multiple_realizations, any other
+    signature is hashed into a stable 64 bit index
+
+    Args:
+        signature: the signature of a realization
+
+    Returns:
+        int
+    '''
+    try:
+        return int(signature)
+    except (TypeError, ValueError):
+        return int.from_bytes(hashlib.blake2b(str(signature).encode(), digest_size=8).digest(), 'little')
+
+
+def spawn_generators(entropy, count):
+    ''' returns count independent numpy Generators spawned from the root '''
+    return [np.random.default_rng(child) for child in np.random.SeedSequence(entropy).spawn(count)]
@@ -0,0 +1,79 @@
+import json
+import numpy as np
+
+
+#==============================================================================
+# the results of a sweep are kept in a single .npy file holding an array of
+# shape (R,len(T)+1,len(N)), i.e the observable of every realization at every
+# time of create_index(T) for every n. the file is preallocated (filled with
+# nan) and memory-mapped, so every worker writes its own slice in place and
+# readers only load the slices they access. N and T are kept in a json file
+# next to it
+#==============================================================================
+
+def metadata_path(path):
+    return path + '.json'
+
+
+def create_results_store(path, R, N, T):
+    ''' preallocates a results store for R realizations of the sweep (N,T)
+
+    Args:
+        path (string): the path of the .npy file
+        R (int): the number of realizations
+        N (list): number of particles
+        T (list): propagation times
+
+    Returns:
+        numpy memmap of shape (R,len(T)+1,len(N)) filled with nan
+    '''
+    store = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64,
+                                      shape=(R, len(T)+1, len(N)))
+    store[:] = np.nan
+    store.flush()
+    with open(metadata_path(path), 'w') as metadata:
+        json.dump({'N': [int(n) for n in N], 'T': [int(t) if float(t).is_integer() else float(t) for t in T]}, metadata)
+    return store
+
+
+def open_results_store(path, mode='r'):
+    ''' maps an existing results store without loading it into memory
+
+    Args:
+        path (string): the path of the .npy file
+        mode (string): 'r' for reading, 'r+' for writing into the store
+
+    Returns:
+        numpy memmap of shape (R,len(T)+1,len(N))
+    '''
+    return np.load(path, mmap_mode=mode)
+
+
+def load_store_metadata(path):
+    ''' returns the lists N and T of a results store '''
+    with open(metadata_path(path)) as metadata:
+        parameters = json.load(metadata)
+    return parameters['N'], parameters['T']
+
+
+def write_results(path, realization, n_loc, values):
+    ''' writes the values of one (realization, n) task into a results store
+
+    Args:
+        path (string): the path of the .npy file
+        realization (int): the index of the realization
+        n_loc (int): the index of n in N
+        values (list): the observable at every time of create_index(T)
+
+    Returns:
+        None
+    '''
+    store = open_results_store(path, 'r+')
+    store[realization, :, n_loc] = values
+    store.flush()
+    del store
+
+
+def completed_tasks(path):
+    ''' returns a boolean (R,len(N)) array of the tasks already in the store '''
+    return ~np.isnan(open_results_store(path)).any(axis=1)
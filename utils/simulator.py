@@ -1,37 +1,331 @@
-from models.clg import create_clg_lattice, parallel_update, clg_activity
-from models.manna import create_manna_lattice, parallel_manna_update, manna_activity
-from measures.compression import cid
+from models.clg import create_clg_lattice, parallel_update, random_sequential_update, gillespie_clg_update, clg_activity
+from models.clg import create_clg_ensemble, batched_random_sequential_update, create_active_site_index
+from models.manna import create_manna_lattice, create_manna_ensemble, vectorized_manna_update, gillespie_manna_update, manna_activity
+from observables.measurements import measure as measure_observables, observable_shape, VECTOR_OBSERVABLES
+from utils.results_store import create_results_store, write_results
+from utils.checkpoint import checkpoint_path, load_checkpoint, save_checkpoint, matches_checkpoint
+from utils.random_generators import root_sequence, task_generator, spawn_generators, realization_key
+from utils.instrumentation import Recorder, recording, records_path, profile_path, profile_call, load_records, summarize_records
 
+import os
+import numpy as np
 import pandas as pd
-import multiprocessing as mp
-import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 Z=2
 #==============================================================================
-# create_multiple_realizations_data(L,N,T,R)
-# this function employs parallel computation to distributelly compute multiple
-# realizations at once. The output data is stored in csv files named
-# realization_{i} where i is a sequential running index
-#==============================================================================
-def create_multiple_realizations(L,N,T,R,model = 'clg',observable = 'cid'):
-    cores = mp.cpu_count()
-    # if the numbers of cores is not a divisor of R return an error
-    if (R%cores!=0):
-        print("the number of realizations must be a multiplication of the"\
-              "number of cores which is {}".format(cores))
+# create_multiple_realizations(L,N,T,R)
+# this function employs a pool of worker processes to distributelly compute
+# multiple realizations. every (realization, n) pair is an independent task
+# and the tasks are submitted from the highest density to the lowest one so
+# that the longest tasks start first and the short ones fill the gaps at the
+# end. workers is the number of processes (all the cores by default) and R
+# does not need to be a multiple of it.
+# if store is the path of a .npy file, a results store is preallocated there
+# (see utils.results_store) and every worker writes its values directly into
+# it, otherwise the values are sent back to the main process.
+# if statistics is a RunningStatistics (see utils.data_analysis_tools) the
+# values are folded into it as soon as each task finishes and the statistics
+# are returned instead of the values.
+# if checkpoint is a directory every task saves its state there (see
+# simulate_density) and tasks interrupted by a killed job continue from their
+# last checkpoint when the same sweep is started again. calling it again with
+# further intervals appended to T extends the saved tasks from their final
+# states instead of propagating them from t=0. the sweep is not started at
+# all if the times of a saved checkpoint do not start T.
+# observable is either the name of an observable or a list of names (see
+# observables.measurements.OBSERVABLES) which are all measured on the same
+# snapshots, stores and statistics are only supported for a single observable.
+# returns an array of shape (R,len(T)+1,len(N)) holding the observable of
+# every realization at every time of create_index(T) for every n, or a
+# dictionary of such arrays keyed by observable for a list of observables.
+# dynamics selects the update rule of the lattices (see propagate).
+# every task draws its initial condition and its dynamics from its own numpy
+# Generator spawned from seed for its (realization, n) pair (see
+# utils.random_generators), so the sweep is reproduced by passing the printed
+# entropy of its seed again, whatever the number of workers is.
+# if instrumentation is a directory every task records the time of its phases
+# and counters of its work there (see utils.instrumentation) and their totals
+# over all the tasks are printed at the end. the task profile_task, a
+# (realization, n_loc) pair, is run under cProfile and its statistics are
+# dumped to the instrumentation directory (or the working directory).
+# if tolerance is given every task stops once it has converged (see
+# simulate_density), which pays off with a geometric schedule T (see
+# geometric_schedule), and an (R,len(N)) array of the stop times of the tasks
+# is returned along with the values or the statistics.
+# if tasks is a list of (realization, n_loc) pairs only those tasks are run, in
+# the given order, e.g a shard of a plan of utils.planner, the values of the
+# other tasks are left as allocated (nan in a results store)
+#==============================================================================
+def create_multiple_realizations(L,N,T,R,model = 'clg',observable = 'cid',compressor = 'lz78',workers = None,store = None,statistics = None,checkpoint = None,checkpoint_every = None,dynamics = 'discrete',seed = None,instrumentation = None,profile_task = None,tolerance = None,window = 3,tasks = None):
+    if (max(N) > L) and (model == 'clg'):
+        print("Cannot initailize a density of particles larger than 1")
+        return
+    if not isinstance(observable,str) and (store is not None or statistics is not None):
+        print("results stores and statistics support a single observable")
+        return
+    if observable in VECTOR_OBSERVABLES and (store is not None or statistics is not None):
+        print("results stores and statistics do not support the values of {}".format(observable))
+        return
+    if tolerance is not None and checkpoint:
+        print("adaptive stopping does not support checkpoints")
+        return
+    if tasks is None:
+        tasks = sorted(((r,n_loc) for r in range(R) for n_loc in range(len(N))),
+                       key = lambda task : N[task[1]], reverse = True)
+    tasks = [tuple(task) for task in tasks]
+    # a task whose checkpoint T does not extend would return no values
+    if checkpoint and not all([matches_checkpoint(checkpoint_path(checkpoint,r,N[n_loc]),T) for r,n_loc in tasks]):
+        print("the sweep was not started, remove or move the checkpoints which do not match T")
         return
+    if store is not None:
+        results = create_results_store(store,R,N,T)
+    elif statistics is None:
+        results = allocate_results(R,L,N,T,observable)
+    stop_times = np.full((R,len(N)),np.nan)
+    entropy = root_sequence(seed).entropy
+    print("seeding the realizations with the entropy {}".format(entropy))
+    if checkpoint:
+        os.makedirs(checkpoint,exist_ok = True)
+    if instrumentation:
+        os.makedirs(instrumentation,exist_ok = True)
+
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        futures = {}
+        for r,n_loc in tasks:
+            task_checkpoint = checkpoint_path(checkpoint,r,N[n_loc]) if checkpoint else None
+            rng = task_generator(entropy,r,n_loc)
+            recorder = Recorder(r,N[n_loc],records_path(instrumentation,r,N[n_loc])) if instrumentation else None
+            if store is None:
+                task = (simulate_density,L,N[n_loc],T,model,observable,compressor,
+                        task_checkpoint,checkpoint_every,dynamics,rng,recorder,tolerance,window)
+            else:
+                task = (simulate_density_to_store,store,r,n_loc,L,N[n_loc],T,model,observable,compressor,
+                        task_checkpoint,checkpoint_every,dynamics,rng,recorder,tolerance,window)
+            if profile_task == (r,n_loc):
+                task = (profile_call,profile_path(instrumentation or '.',r,N[n_loc])) + task
+            future = pool.submit(*task)
+            futures[future] = (r,n_loc)
+        for finished,future in enumerate(as_completed(futures)):
+            r,n_loc = futures[future]
+            values = future.result()
+            if tolerance is not None:
+                if store is not None:
+                    stop_times[r,n_loc] = values
+                else:
+                    values, stop_times[r,n_loc] = values
+            if store is not None:
+                values = results[r,:,n_loc]
+            elif statistics is None:
+                insert_values(results,np.s_[r,:,n_loc],values)
+            if statistics is not None:
+                statistics.update(values,n_loc)
+            print("finished calculating density {} for realization {} ({}/{} tasks)".format(
+                float(N[n_loc])/L, r, finished+1, len(tasks)))
+    if instrumentation:
+        summarize_records(load_records(instrumentation))
+    if statistics is not None:
+        results = statistics
+    if tolerance is not None:
+        return results, stop_times
+    return results
+
+#==============================================================================
+# simulate_density_to_store(store,realization,n_loc,L,n,T)
+# runs simulate_density and writes its values into the results store. the time
+# of the write is recorded as a final record with no time t. returns the stop
+# time of the task if tolerance is given
+#==============================================================================
+def simulate_density_to_store(store,realization,n_loc,L,n,T,model = 'clg',observable = 'cid',compressor = 'lz78',checkpoint = None,checkpoint_every = None,dynamics = 'discrete',rng = None,recorder = None,tolerance = None,window = 3):
+    values = simulate_density(L,n,T,model,observable,compressor,checkpoint,checkpoint_every,dynamics,rng,recorder,tolerance,window)
+    stop_time = None
+    if tolerance is not None:
+        values, stop_time = values
+    with recording(recorder) as recorder:
+        with recorder.phase('write'):
+            write_results(store,realization,n_loc,values)
+        recorder.emit(None)
+    return stop_time
+
+#==============================================================================
+# simulate_density(L,n,T)
+# propagates a single lattice of L sites with n particles and measures the
+# observable at every time of create_index(T).
+# if checkpoint is the path of a checkpoint file (see utils.checkpoint) the
+# state of the task is saved there after every measurement and, if
+# checkpoint_every is given, at least every checkpoint_every updates. an
+# existing checkpoint is continued instead of starting over, and a checkpoint
+# saved for a shorter schedule which T extends is propagated by the additional
+# times only. a checkpoint saved for a schedule T does not extend is left
+# untouched and nothing is returned. once the lattice is absorbed neither
+# updates nor measurements are performed and the last value is repeated.
+# returns the list of the measured values, or a dictionary of such lists keyed
+# by observable for a list of observables. with the 'gillespie' dynamics the
+# times in T are continuous times instead of numbers of updates (see propagate).
+# rng is the numpy Generator of the task, its state is checkpointed with the
+# lattice so a resumed task continues the same random stream. the random
+# sequential clg update keeps a single active sites index for the whole task,
+# which is checkpointed as well, so neither checkpoint_every nor resuming
+# changes the hops drawn for a seed. the event driven 'gillespie' updates draw
+# a waiting time past the end of every call, so their streams (though not
+# their statistics) depend on where the propagation is split.
+# if recorder is a Recorder (see utils.instrumentation) the time of every phase
+# and the steps, active sites and compression counters are recorded and a
+# record is emitted for every time of create_index(T). the active sites are
+# only counted for the 'discrete' dynamics.
+# if tolerance is given the task also stops once the last window values of the
+# observable (the first one of a list) have converged (see has_converged), the
+# last value is repeated for the remaining times as for an absorbed lattice,
+# and the values are returned together with the time the task stopped at (the
+# last time of create_index(T) if it never did)
+#==============================================================================
+def simulate_density(L,n,T,model = 'clg',observable = 'cid',compressor = 'lz78',checkpoint = None,checkpoint_every = None,dynamics = 'discrete',rng = None,recorder = None,tolerance = None,window = 3):
+    stop_observable = observable if isinstance(observable,str) else observable[0]
+    if tolerance is not None and stop_observable in VECTOR_OBSERVABLES:
+        print("the convergence of {} cannot be tested, it is not a number".format(stop_observable))
+        return
+    with recording(recorder) as recorder:
+        with recorder.phase('initialize'):
+            if checkpoint and os.path.exists(checkpoint):
+                state = load_checkpoint(checkpoint,T,model,rng)
+                if state is None:
+                    return
+                lattice, steps, values, sites = state
+            else:
+                if (model == 'clg'):
+                    lattice = create_clg_lattice(n,L,rng)
+                elif (model == 'manna'):
+                    lattice = create_manna_lattice(n,L,rng)
+                steps, values, sites = 0, None, None
+            if model == 'clg' and dynamics == 'discrete':
+                active_sites = create_active_site_index(lattice,sites)
+            else:
+                active_sites = None
+        if values is None:
+            with recorder.phase('measure'):
+                values = [measure(lattice,model,observable,compressor,rng)]
+            recorder.emit(0)
+        times = create_index(T)
+        absorbed = False
+        stop_time = None
+
+        for t_loc in range(len(values)-1,len(T)):
+            if stop_time is not None:
+                # an absorbed (or converged) lattice is no longer propagated
+                steps = times[t_loc+1]
+                values.append(values[-1])
+            else:
+                while steps < times[t_loc+1] and not absorbed:
+                    t = times[t_loc+1] - steps
+                    if checkpoint_every:
+                        t = min(t,checkpoint_every)
+                    activity = np.zeros(t) if recorder.enabled and dynamics == 'discrete' else None
+                    with recorder.phase('update'):
+                        absorbed = propagate(lattice,t,model,dynamics,rng,activity,active_sites)
+                    recorder.count('steps',t)
+                    if activity is not None:
+                        # one hop per step of clg, every active site topples in a manna step
+                        recorder.count('active_sites',int(np.count_nonzero(activity)) if model == 'clg'
+                                       else int(round(activity.sum()*L)))
+                    steps += t
+                    if checkpoint and steps < times[t_loc+1] and not absorbed:
+                        with recorder.phase('checkpoint'):
+                            save_checkpoint(checkpoint,lattice,steps,T[:t_loc],values,model,rng,active_sites)
+                steps = times[t_loc+1]
+                with recorder.phase('measure'):
+                    values.append(measure(lattice,model,observable,compressor,rng))
+                if absorbed or (tolerance is not None and has_converged(
+                        [value if isinstance(observable,str) else value[stop_observable] for value in values[-window:]],
+                        tolerance,window)):
+                    stop_time = times[t_loc+1]
+            if checkpoint:
+                with recorder.phase('checkpoint'):
+                    save_checkpoint(checkpoint,lattice,steps,T[:t_loc+1],values,model,rng,active_sites)
+            recorder.emit(times[t_loc+1])
+    if not isinstance(observable,str):
+        values = {name : [value[name] for value in values] for name in observable}
+    if tolerance is not None:
+        return values, stop_time if stop_time is not None else times[-1]
+    return values
+
+#==============================================================================
+# has_converged(values,tolerance,window)
+# plateau test of the adaptive stopping: True if there are at least window
+# values and the spread of the last window of them is within tolerance of
+# their mean
+#==============================================================================
+def has_converged(values,tolerance = 0.01,window = 3):
+    if len(values) < window:
+        return False
+    recent = np.asarray(values[-window:],dtype = float)
+    return np.ptp(recent) <= tolerance*abs(recent.mean())
+
+#==============================================================================
+# geometric_schedule(t_max,first,ratio)
+# returns the propagation times T of a geometric schedule which samples at the
+# times first, first*ratio, first*ratio**2 ... and finally at t_max, so the
+# adaptive stopping tests convergence with a cost logarithmic in t_max
+#==============================================================================
+def geometric_schedule(t_max,first = 100,ratio = 2):
+    times = []
+    time = first
+    while time < t_max:
+        times.append(time)
+        time = int(np.ceil(time*ratio))
+    times.append(t_max)
+    return [times[0]] + [times[i] - times[i-1] for i in range(1,len(times))]
+
+#==============================================================================
+# propagate(lattice,t,model,dynamics,rng)
+# propagates a lattice by t updates ('discrete' dynamics) or for a time t with
+# the event driven continuous time updates ('gillespie' dynamics) whose work
+# is proportional to the activity, which pays off near the critical density.
+# the random numbers are drawn from the numpy Generator rng if given. the
+# activity before every update of the 'discrete' dynamics is written into the
+# array activity if given. the ActiveSiteIndex active_sites of a clg lattice
+# is kept across the calls with the 'discrete' dynamics if given (see
+# random_sequential_update). returns True if the lattice has been absorbed
+#==============================================================================
+def propagate(lattice,t,model = 'clg',dynamics = 'discrete',rng = None,activity = None,active_sites = None):
+    if (dynamics == 'gillespie'):
+        if (model == 'clg'):
+            return gillespie_clg_update(lattice,t,rng)
+        return gillespie_manna_update(lattice,t,Z,rng = rng)
+    if (model == 'clg'):
+        return random_sequential_update(lattice,t,activity,rng,active_sites)
+    return vectorized_manna_update(lattice,t,Z,activity = activity,rng = rng)
+
+#==============================================================================
+# measure(lattice,model,observable)
+# returns the observable of a lattice (or of every row of an ensemble), or a
+# dictionary of the observables measured in a single pass for a list of them
+#==============================================================================
+def measure(lattice,model = 'clg',observable = 'cid',compressor = 'lz78',rng = None):
+    if isinstance(observable,str):
+        return measure_observables(lattice,[observable],model,Z,compressor,rng)[observable]
+    return measure_observables(lattice,observable,model,Z,compressor,rng)
 
-    for batch in range(0,R,cores):
-        processes = []
-        for batch_realization in range(cores):
-            processes.append(mp.Process(target=create_realization,\
-                       args=(L,N,T,str(batch_realization+batch),model,observable)))
-            processes[batch_realization].start()
+#==============================================================================
+# allocate_results(R,L,N,T,observable)
+# returns the (R,len(T)+1,len(N)) array of the values of a sweep, or for a list
+# of observables a dictionary of such arrays (with an extra axis for observables
+# whose values are arrays themselves)
+#==============================================================================
+def allocate_results(R,L,N,T,observable = 'cid'):
+    if isinstance(observable,str):
+        return np.zeros((R,len(T)+1,len(N))+observable_shape(observable,L))
+    return {name : allocate_results(R,L,N,T,name) for name in observable}
 
-        while True in [processes[batch_realization].is_alive() \
-                       for batch_realization in range(cores)]:
-            time.sleep(15)
-        print("finished computation of {} realizations".format((batch+cores)))
+#==============================================================================
+# insert_values(results,index,values)
+# writes values (or a dictionary of values) at index of the results
+#==============================================================================
+def insert_values(results,index,values):
+    if isinstance(results,dict):
+        for name in results:
+            results[name][index] = values[name]
+    else:
+        results[index] = values
 
 #==============================================================================
 # create_realization(L,N,T)
@@ -40,62 +334,161 @@ def create_multiple_realizations(L,N,T,R,model = 'clg',observable = 'cid'):
 # of time steps for which the system is sampled by measuring its cid.
 # it creates a dataframe file with each column matching the different number of
 # particle options and rows for the respective time steps named
-# realization{signature}
+# realization{signature}. the cid is computed with the compression backend
+# named compressor (see observables.compression.COMPRESSORS). if store is the
+# path of an existing results store the values are written into the row
+# int(signature) of the store instead of the csv file, which requires a
+# numeric signature. if checkpoint is a
+# directory the tasks are checkpointed there as in create_multiple_realizations.
+# for a list of observables a csv file realization{signature}_{observable} is
+# created for each one of them. dynamics selects the update rule (see propagate).
+# the tasks are seeded as the realization int(signature) of
+# create_multiple_realizations with the same seed, a non numeric signature is
+# hashed into the index of its realization (see realization_key). the entropy
+# of the seed is printed, passing it as the seed reproduces the realization. if
+# instrumentation is a
+# directory the tasks are instrumented as in create_multiple_realizations and
+# the time of writing the results is recorded with no n.
+# if tolerance is given the tasks stop adaptively (see simulate_density) and
+# their stop times are written to realization{signature}_stop_times.csv
 #==============================================================================
-def create_realization(L,N,T,signature,model = 'clg',observable = 'cid'):
+def create_realization(L,N,T,signature,model = 'clg',observable = 'cid',compressor = 'lz78',store = None,checkpoint = None,checkpoint_every = None,dynamics = 'discrete',seed = None,instrumentation = None,tolerance = None,window = 3):
     if (max(N) > L) and (model == 'clg'):
         print("Cannot initailize a density of particles larger than 1")
         return
-    data = pd.DataFrame(index = create_index(T))
+    if not isinstance(observable,str) and store is not None:
+        print("results stores support a single observable")
+        return
+    if observable in VECTOR_OBSERVABLES and store is not None:
+        print("results stores do not support the values of {}".format(observable))
+        return
+    if store is not None and not str(signature).isdigit():
+        print("the signature of a realization written to a results store must be its row")
+        return
+    if tolerance is not None and checkpoint:
+        print("adaptive stopping does not support checkpoints")
+        return
+    if checkpoint and not all([matches_checkpoint(checkpoint_path(checkpoint,signature,n),T) for n in N]):
+        print("the realization was not started, remove or move the checkpoints which do not match T")
+        return
+    names = [observable] if isinstance(observable,str) else observable
+    data = {name : pd.DataFrame(index = create_index(T)) for name in names}
+    stop_times = pd.DataFrame(index = [signature])
+    entropy = root_sequence(seed).entropy
+    print("seeding the realization {} with the entropy {}".format(signature,entropy))
+    if checkpoint:
+        os.makedirs(checkpoint,exist_ok = True)
+    if instrumentation:
+        os.makedirs(instrumentation,exist_ok = True)
 
-    for n in N:
-        if (model == 'clg'):
-            lattice = create_clg_lattice(n,L)
-            if (observable == 'cid'):
-                values = [cid(''.join(str(int(x)) for x in lattice))]
-            elif (observable == 'activity'):
-                values = [clg_activity(lattice)]
-            for t in T:
-                parallel_update(lattice,t,True)
-                if (observable == 'cid'):
-                    values.append(cid(''.join(str(int(x)) for x in lattice)))
-                elif (observable == 'activity'):
-                    values.append(clg_activity(lattice))
-
-            data[str(n)] = values
-            data.to_csv("realization{}.csv".format(signature))
-        elif (model == 'manna'):
-            lattice = create_manna_lattice(n,L)
-            if (observable == 'cid'):
-                values = [cid(lattice,model)]
-            elif (observable == 'activity'):
-                values = [manna_activity(lattice, Z)]
-            for t in T:
-                parallel_manna_update(lattice,t, Z)
-                if (observable == 'cid'):
-                    values.append(cid(lattice, model))
-                elif (observable == 'activity'):
-                    values.append(manna_activity(lattice, Z))
-            data[str(n)] = values
-            data.to_csv("realization{}.csv".format(signature))
+    for n_loc,n in enumerate(N):
+        task_checkpoint = checkpoint_path(checkpoint,signature,n) if checkpoint else None
+        rng = task_generator(entropy,realization_key(signature),n_loc)
+        recorder = Recorder(signature,n,records_path(instrumentation,signature,n)) if instrumentation else None
+        values = simulate_density(L,n,T,model,observable,compressor,task_checkpoint,checkpoint_every,dynamics,rng,recorder,tolerance,window)
+        if tolerance is not None:
+            values, stop_times[str(n)] = values
+        if store is not None:
+            write_results(store,int(signature),n_loc,values)
+        elif isinstance(observable,str):
+            data[observable][str(n)] = values
+        else:
+            for name in names:
+                data[name][str(n)] = [np.asarray(value).tolist() for value in values[name]]
         print("finished calculating density {} for signature {}".format(float(n)/L, signature))
+    recorder = Recorder(signature,None,records_path(instrumentation,signature,'csv')) if instrumentation else None
+    with recording(recorder) as recorder:
+        if store is None:
+            with recorder.phase('write'):
+                if isinstance(observable,str):
+                    data[observable].to_csv("realization{}.csv".format(signature))
+                else:
+                    for name in names:
+                        data[name].to_csv("realization{}_{}.csv".format(signature,name))
+                if tolerance is not None:
+                    stop_times.to_csv("realization{}_stop_times.csv".format(signature))
+            recorder.emit(None)
     return
 
-def compare_dynamical_rules(timesteps, timestep, length):
-    activity_parallel = []
-    activity_random = []
+#==============================================================================
+# create_ensemble(L,N,T,R)
+# batched alternative to create_multiple_realizations. for every n in N all R
+# realizations are stored as the rows of one (R,L) array which is propagated
+# with vectorized updates, so a single core advances the whole ensemble at once
+# without spawning processes or writing csv files.
+# returns an array of shape (R,len(T)+1,len(N)) holding the observable of
+# every realization at every time of create_index(T) for every n, or a
+# dictionary of such arrays keyed by observable for a list of observables.
+# the ensemble of every n is driven by its own numpy Generator spawned from seed
+#==============================================================================
+def create_ensemble(L,N,T,R,model = 'clg',observable = 'cid',compressor = 'lz78',seed = None):
+    if (max(N) > L) and (model == 'clg'):
+        print("Cannot initailize a density of particles larger than 1")
+        return
+    results = allocate_results(R,L,N,T,observable)
+    entropy = root_sequence(seed).entropy
+    print("seeding the ensembles with the entropy {}".format(entropy))
+    generators = spawn_generators(entropy,len(N))
 
-    lattice_for_parallel = create_clg_lattice(int(length*0.6),length)
-    lattice_for_random = create_clg_lattice(int(length*0.6),length)
+    for n_loc,n in enumerate(N):
+        rng = generators[n_loc]
+        if (model == 'clg'):
+            lattices = create_clg_ensemble(n,L,R,rng)
+        elif (model == 'manna'):
+            lattices = create_manna_ensemble(n,L,R,rng)
+        insert_values(results,np.s_[:,0,n_loc],measure(lattices,model,observable,compressor,rng))
+        for t_loc,t in enumerate(T):
+            if (model == 'clg'):
+                batched_random_sequential_update(lattices,t,rng = rng)
+            elif (model == 'manna'):
+                vectorized_manna_update(lattices,t,Z,rng = rng)
+            insert_values(results,np.s_[:,t_loc+1,n_loc],measure(lattices,model,observable,compressor,rng))
+        print("finished calculating density {} for {} realizations".format(float(n)/L, R))
+    return results
 
-    for t in range(timesteps):
-        if (t%timestep == 0):
-            activity_parallel.append(clg_activity(lattice_for_parallel))
-            activity_random.append(clg_activity(lattice_for_random))
-        parallel_update(lattice_for_parallel,1)
-        parallel_update(lattice_for_random,1,True)
+#==============================================================================
+# compare_dynamical_rules(timesteps,timestep,length)
+# propagates two clg lattices of density 0.6, one with the reference parallel
+# update (parallel_update, whose competitions differ from the ones of
+# vectorized_parallel_update) and the other with the random sequential one,
+# and returns their activities every timestep updates. the activities of all
+# the updates are recorded by the update functions themselves. each lattice is
+# driven by its own generator spawned from seed
+#==============================================================================
+def compare_dynamical_rules(timesteps, timestep, length, seed = None):
+    activity_parallel = np.zeros(timesteps)
+    activity_random = np.zeros(timesteps)
+    rng_parallel,rng_random = spawn_generators(root_sequence(seed).entropy,2)
+
+    lattice_for_parallel = create_clg_lattice(int(length*0.6),length,rng_parallel)
+    lattice_for_random = create_clg_lattice(int(length*0.6),length,rng_random)
+
+    parallel_update(lattice_for_parallel,timesteps,False,activity_parallel,rng_parallel)
+    random_sequential_update(lattice_for_random,timesteps,activity_random,rng_random)
 
-    return activity_parallel,activity_random
+    return list(activity_parallel[::timestep]),list(activity_random[::timestep])
+
+#==============================================================================
+# record_activity(L,n,timesteps)
+# propagates a single lattice of L sites with n particles for timesteps updates
+# and returns the activity before every update and after the last one. for the
+# manna model the density of the particles on active sites is also returned.
+# the lattice is driven by a generator seeded with seed
+#==============================================================================
+def record_activity(L,n,timesteps,model = 'clg',seed = None):
+    activity = np.zeros(timesteps+1)
+    rng = np.random.default_rng(root_sequence(seed))
+    if (model == 'clg'):
+        lattice = create_clg_lattice(n,L,rng)
+        random_sequential_update(lattice,timesteps,activity,rng)
+        activity[timesteps] = clg_activity(lattice)
+        return activity
+    mass = np.zeros(timesteps+1)
+    lattice = create_manna_lattice(n,L,rng)
+    vectorized_manna_update(lattice,timesteps,Z,activity = activity,mass = mass,rng = rng)
+    activity[timesteps] = np.mean(lattice > Z)
+    mass[timesteps] = manna_activity(lattice,Z)
+    return activity,mass
 
 #==============================================================================
 # create_index(T)